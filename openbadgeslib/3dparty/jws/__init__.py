@@ -51,10 +51,18 @@ def verify_block(msg, key=None):
         # The block has an incorrect format.
         raise SignatureError()
 
+    return verify_parsed(utils.decode(head_encoded),
+                         head_encoded + b'.' + payload_encoded,
+                         utils.from_base64(signature_encoded), key)
+
+# Verify a block already parsed: its decoded header, the signing input
+# (encoded header and payload, any bytes-like object) and the raw signature.
+# The payload is not decoded.
+def verify_parsed(head, signing_input, signature, key=None):
     data = {
         'key': key,
-        'header': utils.decode(head_encoded),
-        'payload': utils.decode(payload_encoded),
+        'header': head,
+        'payload': None,
         'verifier': None
     }
     # TODO: re-evaluate whether to pass ``data`` by reference, or to copy and reassign
@@ -64,8 +72,7 @@ def verify_block(msg, key=None):
     if not data['verifier']:
         raise MissingVerifier("Header was processed, but no algorithm was found to sign the message")
     verifier = data['verifier']
-    signature = utils.from_base64(signature_encoded)
-    return verifier(head_encoded + b'.' + payload_encoded, signature, key)
+    return verifier(signing_input, signature, key)
 
 ####################
 # semi-private api #
@@ -3,8 +3,12 @@ import re
 from .exceptions import SignatureError, RouteMissingError, RouteEndpointError
 
 class AlgorithmBase(object):
-    """Base for algorithm support classes."""
-    pass
+    """
+    Base for algorithm support classes. The instances of ``reusable``
+    algorithms don't keep state between calls, so their routes are memoized
+    and shared by all the signatures.
+    """
+    reusable = True
 
 class HasherBase(AlgorithmBase):
     """
@@ -66,19 +70,17 @@ class RSABase(HasherBase):
     def __init__(self, padder, bits):
         super(RSABase,self).__init__(bits)
         self.padder = padder
-        from Crypto.Hash import SHA256,SHA384,SHA512
-        self.hashm = __import__('Crypto.Hash.SHA%d'%self.bits, globals(), locals(), ['*']).new()
+        # The hash module, every call hashes with a new digest object so
+        # the algorithm can be shared by threads and memoized routes
+        self.hashmod = __import__('Crypto.Hash.SHA%d'%self.bits, globals(), locals(), ['*'])
 
     def sign(self, msg, key):
         """
         Signs a message with an RSA PrivateKey and hash method
         """
-        import Crypto.PublicKey.RSA as RSA
-
-        self.hashm.update(msg)
         ## assume we are dealing with a real key
         # private_key = RSA.importKey(key)
-        return self.padder.new(key).sign(self.hashm)             # pycrypto 2.5
+        return self.padder.new(key).sign(self.hashmod.new(msg))  # pycrypto 2.5
 
     def verify(self, msg, crypto, key):
         """
@@ -89,11 +91,10 @@ class RSABase(HasherBase):
         """
         import Crypto.PublicKey.RSA as RSA
 
-        self.hashm.update(msg)
         private_key = key
         if not isinstance(key, RSA._RSAobj):
             private_key = RSA.importKey(key)
-        if not self.padder.new( private_key ).verify(self.hashm,  crypto):  #:pycrypto 2.5
+        if not self.padder.new( private_key ).verify(self.hashmod.new(msg),  crypto):  #:pycrypto 2.5
             raise SignatureError("Could not validate signature")
         return True
 
@@ -153,6 +154,29 @@ ecdsa signture encapsulation
 def route(name):
     return resolve(*find(name))
 
+# memoized routes of the reusable algorithms, by name
+ROUTES = {}
+
+def cached_route(name):
+    """
+    Like ``route``, but the sign and verify methods of reusable algorithms
+    are kept by name, so the routing runs once per algorithm. Call
+    ``clear_routes`` after changing ``CUSTOM``.
+    """
+    try:
+        return ROUTES[name]
+    except KeyError:
+        pass
+
+    endpoint, match = find(name)
+    crypt = resolve(endpoint, match)
+    if getattr(endpoint, 'reusable', False):
+        ROUTES[name] = crypt
+    return crypt
+
+def clear_routes():
+    ROUTES.clear()
+
 def find(name):
     # TODO: more error checking around custom algorithms
     algorithms = CUSTOM + list(DEFAULT)
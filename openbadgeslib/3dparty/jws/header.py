@@ -26,12 +26,16 @@ class NotImplemented(HeaderBase):
     def clean(self, *a):
         raise ParameterNotUnderstood("Could not find an action for Header Parameter '%s'" % self.name)
 
+def algorithm_methods(value):
+    """Sign and verify methods of the algorithm, memoized if possible"""
+    try:
+        return algos.cached_route(value)
+    except RouteMissingError:
+        raise AlgorithmNotImplemented('"%s" not implemented.' % value)
+
 class Algorithm(HeaderBase):
     def clean(self, value):
-        try:
-            self.methods = algos.route(value)
-        except RouteMissingError:
-            raise AlgorithmNotImplemented('"%s" not implemented.' % value)
+        self.methods = algorithm_methods(value)
 
     def sign(self):
         self.data['signer'] = self.methods['sign']
@@ -53,9 +57,17 @@ KNOWN_HEADERS = {
     'x5t': VerifyNotImplemented,
 }
 
+# key of data set by the algorithm in every step
+STEP_KEYS = {'sign': 'signer', 'verify': 'verifier'}
+
 # data is by reference
 def process(data, step):
     for param in data['header']:
+        if param == 'alg':
+            # Fast path, a lookup of the memoized route
+            data[STEP_KEYS[step]] = algorithm_methods(data['header'][param])[step]
+            continue
+
         # The JWS Header Input MUST be validated to only include parameters
         # and values whose syntax and semantics are both understood and
         # supported. --- this is why it defaults to NotImplemented, which
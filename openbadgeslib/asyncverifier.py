@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import asyncio
+import functools
+
+from urllib.error import HTTPError, URLError
+
+from .errors import AssertionFormatIncorrect, VerifyKeyUnavailable
+from .jws import utils as jws_utils
+from .jws.exceptions import SignatureError as JWS_SignatureError
+from .keyring import default_keyring
+from .badge import BadgeStatus
+from .resolver import KeyResolver, DownloadKeyResolver
+from .util import fetch_url
+from .verifier import Verifier, VerifyInfo, BADGE_ERRORS, \
+            check_assertion_signature
+
+class ThreadTransport():
+    """ HTTP transport of the AsyncVerifier running a blocking fetch
+        function, util.fetch_url by default, in the executor of the loop.
+
+        A transport is a coroutine function (url, headers=None) returning a
+        HttpResponse, any other one can replace it. """
+
+    def __init__(self, fetch=fetch_url, executor=None):
+        self.fetch = fetch
+        self.executor = executor            # None is the default executor
+
+    async def __call__(self, url, headers=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor,
+                        functools.partial(self.fetch, url, headers=headers))
+
+class _FetchedKeyResolver(KeyResolver):
+    """ Resolve the verify keys already downloaded by an AsyncVerifier """
+
+    def __init__(self, requests):
+        self.requests = requests            # Url -> Finished task
+        self.keys = dict()
+
+    def resolve(self, url):
+        if url not in self.keys:
+            # Raise the error of the download, if any
+            pem = self.requests[url].result()
+            record = default_keyring.load_public_key(pem, url)
+            self.keys[url] = (pem, record.key_type, record.key)
+
+        return self.keys[url]
+
+def _check_signature(assertion, key):
+    """ Return True if the JWS signature of the Assertion is valid """
+
+    try:
+        return bool(check_assertion_signature(assertion, key))
+    except JWS_SignatureError:
+        return False
+
+class AsyncVerifier():
+    """ Verify badges with asyncio.
+
+        The verify keys, badge json, issuer json and revocation lists of all
+        the badges being verified are downloaded concurrently, at most
+        'concurrency' requests at a time, and every url only once in the
+        life of the verifier. The signatures are checked in an executor,
+        a thread pool by default, so they don't block the loop. With
+        precompute=True the ECC keys have precomputed tables, like in the
+        Verifier.
+
+        Use a new AsyncVerifier for every batch, so fresh revocation lists
+        are downloaded:
+
+            loop.run_until_complete(AsyncVerifier(identity).verify_many(badges))
+    """
+
+    def __init__(self, identity=None, verify_key=None, transport=None,
+                 concurrency=8, executor=None, precompute=False):
+        self.verifier = Verifier(verify_key=verify_key, identity=identity,
+                                 precompute=precompute)
+        self.transport = transport or ThreadTransport()
+        self.concurrency = concurrency
+        self.executor = executor            # Executor of the signature checks
+
+        self._requests = dict()             # Url -> Task with the body
+        self._parsed = dict()               # Url -> Parsed json
+        self._revocations = dict()          # Revocation url -> Serial number -> Reason
+        self._semaphore = None
+        self.key_resolver = _FetchedKeyResolver(self._requests)
+
+    def _request(self, url):
+        task = self._requests.get(url)
+
+        if task is None or task.cancelled():
+            task = asyncio.ensure_future(self._download(url))
+            self._requests[url] = task
+
+        return task
+
+    async def _download(self, url):
+        # Created here to belong to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            response = await self.transport(url)
+
+        return response.body
+
+    async def fetch(self, url):
+        """ Return the body of the url, downloading it only once """
+
+        while True:
+            task = self._request(url)
+            try:
+                # Shared by other badges, it is not cancelled with us
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+                # Abandoned by another batch, download it again
+
+    async def get_json(self, url, name):
+        """ Return the json of the url, parsed only once """
+
+        body = await self.fetch(url)
+
+        if url not in self._parsed:
+            if not body:
+                raise AssertionFormatIncorrect('%s JSON doesn\'t exists %s' % (name, url))
+            try:
+                self._parsed[url] = jws_utils.from_json(body)
+            except:
+                raise AssertionFormatIncorrect('%s JSON format incorrect at %s' % (name, url))
+
+        return self._parsed[url]
+
+    async def get_field(self, url, name, field):
+        try:
+            return (await self.get_json(url, name))[field]
+        except (KeyError, TypeError):
+            raise AssertionFormatIncorrect('%s JSON without %s at %s' % (name, field, url))
+
+    async def get_revocations(self, json_url):
+        """ Return the revocation list of the issuer of a badge, as a dict
+            of serial number -> reason. It is built once for all the badges
+            of the issuer. """
+
+        issuer_url = await self.get_field(json_url, 'Badge', 'issuer')
+        url = await self.get_field(issuer_url, 'Issuer', 'revocationList')
+        body = await self.fetch(url)
+
+        if url not in self._revocations:
+            try:
+                self._revocations[url] = dict(jws_utils.from_json(body) or dict())
+            except:
+                raise AssertionFormatIncorrect('Revocation list format incorrect at %s' % url)
+
+        return self._revocations[url]
+
+    async def get_verify_key(self, badge):
+        """ Return the key used to verify a badge, downloading it if the
+            badge would do it """
+
+        if (not self.verifier.pub_key and badge.source.pubkey_pem is None
+                and isinstance(badge.key_resolver, DownloadKeyResolver)):
+            # Errors are raised by the resolver as VerifyKeyUnavailable
+            await asyncio.wait([self._request(badge.source.verify_key_url)])
+            return badge.resolve_key(self.key_resolver)
+
+        return self.verifier.get_verify_key(badge)
+
+    async def get_badge_status(self, badge, identity=None):
+        """ Verify a badge for the identity of the verifier, or the given
+            one """
+
+        # Start the download of the revocation list with the key's one. Its
+        # errors are only relevant if the signature is valid.
+        revocations = asyncio.ensure_future(self.get_revocations(badge.source.json_url))
+        revocations.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        try:
+            try:
+                await self.get_verify_key(badge)
+            except VerifyKeyUnavailable as err:
+                return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, str(err))
+
+            key = self.verifier.get_signature_key(badge)
+
+            self.verifier.check_ecc_disclaimer(self.verifier.key_type or badge.source.key_type)
+
+            loop = asyncio.get_event_loop()
+            valid = await loop.run_in_executor(self.executor, _check_signature,
+                                               badge.assertion, key)
+            if not valid:
+                return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, 'Signature invalid, corrupted or tampered')
+
+            reason = (await revocations).get(badge.serial_num)
+            return self.verifier.get_assertion_status(badge, identity, reason)
+
+        except (HTTPError, URLError) as e:
+            return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, e.reason)
+
+        finally:
+            # Not needed if the badge is not valid
+            if not revocations.done():
+                revocations.cancel()
+                await asyncio.wait([revocations])
+
+    async def verify_many(self, badges):
+        """ Verify a batch of badges concurrently, returning a list of
+            VerifyInfo in the same order. The items are BadgeSigned objects,
+            verified for the identity of the verifier, or (BadgeSigned,
+            identity) pairs. A badge that can't be verified is reported as a
+            SIGNATURE_ERROR. """
+
+        async def verify(item):
+            badge, identity = item if isinstance(item, tuple) else (item, None)
+            try:
+                return await self.get_badge_status(badge, identity)
+            except BADGE_ERRORS as err:
+                return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, str(err) or repr(err))
+
+        try:
+            # Every badge is finished before an unexpected error is raised
+            checks = await asyncio.gather(*[verify(item) for item in badges],
+                                          return_exceptions=True)
+            for check in checks:
+                if isinstance(check, BaseException):
+                    raise check
+
+            return checks
+        finally:
+            # Downloads only wanted by badges with errors
+            pending = []
+            for url, task in list(self._requests.items()):
+                if not task.done():
+                    task.cancel()
+                    pending.append(task)
+                    del self._requests[url]
+
+            if pending:
+                await asyncio.wait(pending)
+
+if __name__ == '__main__':
+    pass
@@ -22,19 +22,20 @@
 """
 
 import os, sys
+import mmap
 from enum import Enum
 
-from Crypto.PublicKey import RSA
-from ecdsa import SigningKey, VerifyingKey, NIST256p
-from xml.dom.minidom import parseString
-from png import Reader
-from struct import unpack
+from xml.parsers.expat import ParserCreate, ExpatError
 
 from .confparser import ConfParser
-from .keys import KeyType, detect_key_type
-from .errors import BadgeImgFormatUnsupported, AssertionFormatIncorrect
+from .keys import KeyType
+from .keyring import default_keyring
+from .errors import BadgeImgFormatUnsupported, AssertionFormatIncorrect, \
+        ErrorParsingFile, VerifyKeyUnavailable
 from .jws import utils as jws_utils
-from .util import hash_email, download_file
+from .pngutils import find_itxt
+from .resolver import DownloadKeyResolver
+from .util import hash_email, default_url_checker
 
 class BadgeStatus(Enum):
     VALID = 1
@@ -53,36 +54,66 @@ class BadgeType(Enum):
     HOSTED = 1
 
 class Assertion():
+    """ A JWS assertion. The header and body are decoded once, when first
+        needed, and an assertion read from a badge keeps its raw bytes so
+        the signing input is a view of them, without copies. """
+
     def __init__(self, header=None, body=None, signature=None):
         self.header = header               # In Base64
         self.body = body                   # In Base64
         self.signature = signature
+        self.raw = None                    # header.body.signature as read
+        self._header = None                # Decoded JSON
+        self._body = None
 
     @staticmethod
     def decode(data):
         try:
+            data = bytes(data)
             header, body, signature = data.split(b'.')
-            return Assertion(header, body, signature)
+            assertion = Assertion(header, body, signature)
+            assertion.raw = data
+            return assertion
         except:
             raise AssertionFormatIncorrect()
 
     def decode_header(self):
-        return jws_utils.decode(self.header)
+        if self._header is None:
+            self._header = jws_utils.decode(self.header)
+        return self._header
 
     def decode_body(self):
-        return jws_utils.decode(self.body)
+        if self._body is None:
+            self._body = jws_utils.decode(self.body)
+        return self._body
+
+    def decode_signature(self):
+        return jws_utils.from_base64(self.signature)
+
+    def get_signing_input(self):
+        """ Return the signed part of the assertion, header.body """
+
+        size = len(self.header) + 1 + len(self.body)
+        if self.raw is not None:
+            return memoryview(self.raw)[:size]
+        return memoryview(self.header + b'.' + self.body)
 
     def get_assertion(self):
+        if self.raw is not None:
+            return self.raw
         return self.header + b'.' + self.body + b'.' + self.signature
 
     def encode_header(self, header):
         self.header = jws_utils.encode(header)
+        self.raw = self._header = None
 
     def encode_body(self, body):
         self.body = jws_utils.encode(body)
+        self.raw = self._body = None
 
     def encode_signature(self, signature):
         self.signature = jws_utils.to_base64(signature)
+        self.raw = None
 
     def __str__(self):
         return 'Header: %s\nBody: %s\nSignature: %s' % (self.header, self.body, self.signature)
@@ -105,18 +136,16 @@ class Badge():
         self.key_type = key_type
         self.privkey_pem = privkey_pem
         self.pubkey_pem = pubkey_pem
+        self.pub_key = None                 # crypto Object
+        self.priv_key = None                # crypto Object
 
-        # Initialize an Key Object
-        if self.key_type is KeyType.RSA:
+        # Initialize an Key Object, parsed once by the keyring
+        if self.key_type in (KeyType.RSA, KeyType.ECC):
             if self.pubkey_pem:
-                self.pub_key = RSA.importKey(self.pubkey_pem)
+                self.pub_key = default_keyring.load_public_key(self.pubkey_pem,
+                                                    self.verify_key_url).key
             if self.privkey_pem:
-                self.priv_key = RSA.importKey(self.privkey_pem)
-        elif self.key_type is KeyType.ECC:
-            if self.pubkey_pem:
-                self.pub_key = VerifyingKey.from_pem(self.pubkey_pem)
-            if self.privkey_pem:
-                self.priv_key = SigningKey.from_pem(self.privkey_pem)
+                self.priv_key = default_keyring.load_private_key(self.privkey_pem).key
 
     @staticmethod
     def create_from_conf(conf, badge):
@@ -131,7 +160,7 @@ class Badge():
             with open(conf[badge]['public_key'], 'rb') as key:
                 pubkey_pem = key.read()
 
-            key_type = detect_key_type(pubkey_pem)
+            key_type = default_keyring.load_public_key(pubkey_pem).key_type
 
             """ Image """
             img_path = os.path.join(conf['paths']['base_image'], conf[badge]['local_image'])
@@ -168,46 +197,24 @@ class Badge():
     def __str__(self):
         return 'INI Name: %s\nName: %s\nDescription: %s\nImage Type: %s\nImage Url: %s\nKey Type: %s\nVerify Key: %s\nJSON Url: %s\n' % (self.ini_name, self.name, self.description, self.image_type, self.image_url, self.key_type, self.verify_key_url, self.json_url)
 
-    def urls_has_problems(self):
-        """ Check if urls in Badge are corrects and online """
+    def urls_has_problems(self, checker=None):
+        """ Check if urls in Badge are corrects and online. The urls are
+            checked in parallel with a UrlChecker, the default one by
+            default, which remembers the urls found online. """
 
-        error = False
-        data = None
+        checker = checker or default_url_checker
 
-        try:
-            data = download_file(self.image_url)
-        except:
-            pass
-        finally:
-            if not data:
-                print('[!] OpenBadge Image at config file is pointing to a wrong url: %s' % self.image_url)
-                error = True
+        urls = ((self.image_url, 'OpenBadge Image at config file is pointing to a wrong url: %s'),
+                (self.criteria_url, 'OpenBadge Criteria at config file is pointing to a wrong url %s'),
+                (self.json_url, 'OpenBadge JSon at config file is pointing to a wrong url %s'),
+                (self.verify_key_url, 'OpenBadge Verify key at config file is poiting to a wrong url %s'))
 
-        try:
-            data = download_file(self.criteria_url)
-        except:
-            pass
-        finally:
-            if not data:
-                print('[!] OpenBadge Criteria at config file is pointing to a wrong url %s' % self.criteria_url)
-                error = True
-
-        try:
-            data = download_file(self.json_url)
-        except:
-            pass
-        finally:
-            if not data:
-                print('[!] OpenBadge JSon at config file is pointing to a wrong url %s' % self.json_url)
-                error = True
+        results = checker.check([url for url, msg in urls])
+        error = False
 
-        try:
-            data = download_file(self.verify_key_url)
-        except:
-            pass
-        finally:
-            if not data:
-                print('[!] OpenBadge Verify key at config file is poiting to a wrong url %s' % self.verify_key_url)
+        for url, msg in urls:
+            if results[url] is not None:
+                print('[!] ' + msg % url)
                 error = True
 
         return error
@@ -217,7 +224,7 @@ class BadgeSigned():
 
     def __init__(self, source=None, serial_num=None, identity=None,
                  evidence=None, expiration=None, salt=None, issue_date=None,
-                 assertion=None):
+                 assertion=None, key_resolver=None):
         self.source = source                     # Badge source object, if exists
         self.signed = None                       # Binary signed data
         self.serial_num = serial_num
@@ -229,21 +236,40 @@ class BadgeSigned():
         self.issue_date = issue_date             # Timestamp
         self.assertion = assertion
         self.file_out = None                     # Path to signed file if saved
+        self.key_resolver = key_resolver         # Gives the verify key on demand
 
     @staticmethod
-    def read_from_file(file_name):
-        """ Read a Signed Badge from file """
-        with open(file_name, 'rb') as file:
-            file_data = file.read()              # Binary Data Signed
+    def read_from_file(file_name, key_resolver=None):
+        """ Read a Signed Badge from file. The file is memory mapped, only
+            the pages needed to find the assertion are read.
+
+            No network access is done here, the verify key is obtained from
+            key_resolver when needed. By default it's downloaded from the
+            verify url of the assertion. """
 
         if file_name.lower().endswith('.svg'):
             img_type = BadgeImgType.SVG
-            assertion = extract_svg_assertion(file_data)
+            extract_assertion = extract_svg_assertion
         elif file_name.lower().endswith('.png'):
             img_type = BadgeImgType.PNG
-            assertion = extract_png_assertion(file_data)
+            extract_assertion = extract_png_assertion
         else:
-            raise BadgeImgFormatUnsupported('The image format for %s is not supported' % badge)
+            raise BadgeImgFormatUnsupported('The image format for %s is not supported' % file_name)
+
+        with open(file_name, 'rb') as file:
+            try:
+                file_data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ErrorParsingFile('The file %s is empty' % file_name)
+
+        try:
+            data = memoryview(file_data)     # Binary Data Signed
+            try:
+                assertion = extract_assertion(data)
+            finally:
+                data.release()
+        finally:
+            file_data.close()
 
         body = assertion.decode_body()
 
@@ -257,26 +283,17 @@ class BadgeSigned():
         except KeyError:
             expiration=None
 
-        try:
-            pubkey_pem = download_file(body['verify']['url'])
-            key_type = detect_key_type(pubkey_pem)
-        except:
-            pubkey_pem = None
-            key_type = None
-            print('Unable to verify OpenBadge Signature. The URL pointing to verify key doesn\'t exists.')
-            print('Url with problems: %s' % body['verify']['url'])
-            sys.exit(-1)
-
-        badge = Badge(image_url=body['image'], verify_key_url=body['verify']['url'],
-                      json_url=body['badge'], key_type=key_type,
-                      pubkey_pem=pubkey_pem)
+        badge = Badge(image_type=img_type, image_url=body['image'],
+                      verify_key_url=body['verify']['url'],
+                      json_url=body['badge'])
 
         badge_sig = BadgeSigned(source=badge, serial_num=body['uid'],
                                 identity=body['recipient']['identity'].encode('utf-8'),
                                 evidence=evidence, expiration=expiration,
                                 salt=body['recipient']['salt'].encode('utf-8'),
                                 issue_date=body['issuedOn'],
-                                assertion=assertion)
+                                assertion=assertion,
+                                key_resolver=key_resolver or DownloadKeyResolver())
         return badge_sig
 
     def save_to_file(self, file_name):
@@ -304,34 +321,79 @@ class BadgeSigned():
     def __str__(self):
         return 'Serial Num: %s\nIdentity: %s\nEvidence %s\nExpiration: %s\nSalt: %s\n' % (self.serial_num, self.identity, self.evidence, self.expiration, self.salt)
 
+    def resolve_key(self, key_resolver=None):
+        """ Return the public key used to sign the openbadge, asking the
+            key resolver for it the first time. key_resolver replaces the
+            one of the badge in this call """
+
+        source = self.source
+        key_resolver = key_resolver or self.key_resolver
+
+        if source.pubkey_pem is None:
+            if not key_resolver:
+                raise VerifyKeyUnavailable('There is no way to get the verify key at %s' % source.verify_key_url)
+
+            try:
+                pem, key_type, key = key_resolver.resolve(source.verify_key_url)
+            except Exception as err:
+                raise VerifyKeyUnavailable('Unable to get the verify key at %s: %s' % (source.verify_key_url, err))
+
+            source.pubkey_pem, source.key_type, source.pub_key = pem, key_type, key
+
+        return source.pub_key
+
     def get_signkey_pem(self):
         """ Return the public key pem used to sign the openbadge """
 
+        self.resolve_key()
         return self.source.pubkey_pem
 
-def extract_svg_assertion(file_data):
-    """ Extract the assertion embeded in a SVG file. """
+class _AssertionFound(Exception):
+    """ Stop the SVG parsing when the assertion tag is reached """
+
+def extract_svg_assertion(file_data, block_size=65536):
+    """ Extract the assertion embeded in a SVG file.
+
+        The document is parsed incrementally, feeding the parser with
+        blocks of data, and the parsing stops at the assertion tag. """
+
+    verify = []
+
+    def start_element(name, attrs):
+        if name == 'openbadges:assertion':
+            verify.append(attrs.get('verify'))
+            raise _AssertionFound()
+
+    parser = ParserCreate()
+    parser.StartElementHandler = start_element
+    data = memoryview(file_data)
 
     try:
-        # Parse de SVG XML
-        svg_doc = parseString(file_data)
-
-        # Extract the assertion
-        xml_node = svg_doc.getElementsByTagName("openbadges:assertion")
-        return Assertion.decode(xml_node[0].attributes['verify'].nodeValue.encode('utf-8'))
-    except:
-        raise ErrorParsingFile('Error Parsing SVG file: ')
+        for offset in range(0, len(data), block_size):
+            parser.Parse(bytes(data[offset:offset+block_size]), False)
+        parser.Parse(b'', True)
+    except _AssertionFound:
+        pass
+    except ExpatError as err:
+        raise ErrorParsingFile('Error Parsing SVG file: %s' % err)
     finally:
-        svg_doc.unlink()
+        data.release()
+
+    if not verify or not verify[0]:
+        raise ErrorParsingFile('Error Parsing SVG file: No assertion found')
+
+    return Assertion.decode(verify[0].encode('utf-8'))
 
 def extract_png_assertion(file_data):
-    png = Reader(bytes=file_data)
+    """ Extract the assertion embeded in a PNG file. Only the chunk
+        headers are read until the openbadges iTXt chunk is found. """
+
+    assertion = find_itxt(file_data, b'openbadges')
+
+    if assertion is None:
+        raise ErrorParsingFile('Error Parsing PNG file: No assertion found')
 
-    for tag, data in png.chunks():
-        if tag == 'iTXt':
-            fmt_len = len(data)-15        # 15=len('openbadges'+pack('BBBBB'))
-            fmt = '<10s5B%ds' % fmt_len
-            return Assertion.decode(unpack(fmt, data)[6])
+    return Assertion.decode(assertion)
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import os
+import posixpath
+
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+from .errors import VerifyKeyUnavailable
+from .keyring import default_keyring
+from .resolver import KeyResolver
+from .util import HttpResponse
+
+class TrustBundle(KeyResolver):
+    """ The public files of an issuer loaded in memory, to verify badges
+        without network.
+
+        The bundle is a directory like the one made by openbadges-publish:
+        organization.json, revoked.json and a directory per badge with its
+        badge.json and verify.pem. A url is found in the bundle by the
+        longest tail of its path that is a file of the bundle, so the
+        bundle doesn't need to know where it is published. A verify key
+        url not in the bundle resolves to the verify.pem of its directory.
+
+        It is a key resolver, and its fetch method replaces util.fetch_url
+        in the caches of the Verifier. """
+
+    KEY_FILE = 'verify.pem'
+
+    def __init__(self, path):
+        self.path = path
+        self.files = dict()                 # Relative path -> Contents
+        self.keys = dict()                  # Url -> (pem, key_type, key)
+
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+
+                file_name = os.path.join(root, name)
+                relative = os.path.relpath(file_name, path).replace(os.sep, '/')
+                with open(file_name, 'rb') as f:
+                    self.files[relative] = f.read()
+
+    def find(self, url):
+        """ Return the contents of the file for the url, or None """
+
+        parts = urlparse(url).path.strip('/').split('/')
+
+        for i in range(len(parts)):
+            contents = self.files.get('/'.join(parts[i:]))
+            if contents is not None:
+                return contents
+
+        return None
+
+    def fetch(self, url, headers=None):
+        """ Answer a GET of the url like util.fetch_url, from memory """
+
+        contents = self.find(url)
+        if contents is None:
+            raise HTTPError(url, 404, '%s is not in the trust bundle %s' % (url, self.path), {}, None)
+
+        return HttpResponse(url, 200, {}, contents)
+
+    def resolve(self, url):
+        if url not in self.keys:
+            pem = self.find(url)
+            if pem is None:
+                directory = posixpath.dirname(urlparse(url).path)
+                pem = self.find(posixpath.join(directory, self.KEY_FILE))
+            if pem is None:
+                raise VerifyKeyUnavailable('The verify key %s is not in the trust bundle %s' % (url, self.path))
+
+            record = default_keyring.load_public_key(pem, url)
+            self.keys[url] = (pem, record.key_type, record.key)
+
+        return self.keys[url]
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import os
+import json
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .errors import UnknownKeyType, AssertionFormatIncorrect
+from .jws import utils as jws_utils
+from .keyring import default_keyring
+from .resolver import KeyResolver
+from .util import fetch_url, cache_lifetime, sha256_string, default_fetcher, \
+            HttpResponse, write_file_atomic
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None                    # Without locks in Windows
+
+@contextmanager
+def _file_lock(file_name):
+    """ Hold an exclusive lock on a file, shared with other processes """
+
+    with open(file_name, 'ab') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class HttpCache():
+    """ Persistent cache of HTTP responses shared by processes.
+
+        The bodies are saved in cache_dir/objects named by their SHA-256,
+        and cache_dir/index has an entry per url with the digest, the fetch
+        time, the expiration and the validators of the response. Every file
+        is written atomically. The responses are fresh during the time
+        given by the Cache-Control header, or ttl seconds, and then
+        revalidated with a conditional request.
+
+        A lock file per url makes the processes missing the same url wait
+        for the first one downloading it, instead of all going to the
+        issuer. It is used installing it in a Fetcher:
+
+            util.default_fetcher.cache = HttpCache(cache_dir)
+    """
+
+    # Request header, index field, response header
+    VALIDATORS = (('If-None-Match', 'etag', 'ETag'),
+                  ('If-Modified-Since', 'last_modified', 'Last-Modified'))
+
+    def __init__(self, cache_dir, ttl=300, fetcher=None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.fetcher = fetcher or default_fetcher
+
+        for directory in ('objects', 'index'):
+            os.makedirs(os.path.join(cache_dir, directory), 0o700, exist_ok=True)
+
+    def fetch(self, url, headers=None):
+        """ Return a HttpResponse for a GET of the url, from the cache if
+            it is fresh. Conditional requests with the validators of the
+            cached response get a 304. """
+
+        headers = headers or {}
+        if set(headers) - set(validator[0] for validator in self.VALIDATORS):
+            return self.fetcher.request(url, 'GET', headers)
+
+        index_file = os.path.join(self.cache_dir, 'index',
+                                  sha256_string(url.encode('utf-8')).decode('latin-1'))
+
+        response = self._lookup(index_file, headers)
+        if response is None:
+            with _file_lock(index_file + '.lock'):
+                # Other process could have downloaded it meanwhile
+                response = self._lookup(index_file, headers)
+                if response is None:
+                    response = self._refresh(url, index_file, headers)
+
+        return response
+
+    def _lookup(self, index_file, headers):
+        entry = self._load(index_file)
+
+        if entry and entry['expires'] > time.time():
+            return self._response(entry, headers)
+
+        return None
+
+    def _response(self, entry, headers, body=None):
+        response_headers = dict()
+        for header, field, response_header in self.VALIDATORS:
+            if entry[field]:
+                response_headers[response_header] = entry[field]
+
+        for header, field, response_header in self.VALIDATORS:
+            if entry[field] and headers.get(header) == entry[field]:
+                return HttpResponse(entry['url'], 304, response_headers)
+
+        if body is None:
+            body = self._read_object(entry['digest'])
+            if body is None:
+                return None
+
+        return HttpResponse(entry['url'], 200, response_headers, body)
+
+    def _refresh(self, url, index_file, headers):
+        entry = self._load(index_file)
+
+        conditional = dict()
+        if entry and self._read_object(entry['digest']) is not None:
+            for header, field, response_header in self.VALIDATORS:
+                if entry[field]:
+                    conditional[header] = entry[field]
+
+        response = self.fetcher.request(url, 'GET', conditional)
+        now = time.time()
+        body = None
+
+        if response.status == 304 and conditional:
+            entry['fetched'] = now
+        else:
+            body = response.body
+            digest = sha256_string(body).decode('latin-1')
+            object_file = os.path.join(self.cache_dir, 'objects', digest)
+            if not os.path.exists(object_file):
+                write_file_atomic(object_file, body)
+
+            entry = dict(url=url, digest=digest, fetched=now,
+                         etag=response.get_header('ETag'),
+                         last_modified=response.get_header('Last-Modified'))
+
+        entry['expires'] = now + cache_lifetime(response, self.ttl)
+        write_file_atomic(index_file, json.dumps(entry).encode('utf-8'))
+
+        return self._response(entry, headers, body)
+
+    def _load(self, index_file):
+        try:
+            with open(index_file, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _read_object(self, digest):
+        """ Return the body with that digest, None if missing or corrupt """
+
+        try:
+            with open(os.path.join(self.cache_dir, 'objects', digest), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+
+        if sha256_string(body).decode('latin-1') != digest:
+            return None
+
+        return body
+
+class _KeyEntry():
+    def __init__(self, pem, key_type, key, expires, etag=None,
+                 last_modified=None):
+        self.pem = pem
+        self.key_type = key_type
+        self.key = key                    # crypto Object
+        self.expires = expires            # Timestamp
+        self.etag = etag
+        self.last_modified = last_modified
+
+class KeyCache(KeyResolver):
+    """ Cache of verify keys by url, usable as a key resolver.
+
+        The PEM and the parsed key are kept in memory, in a LRU of max_keys
+        entries. The keys are fresh during the time given by the
+        Cache-Control header of the server, or ttl seconds if it doesn't
+        say it. Stale keys are revalidated with a conditional request
+        using their ETag and Last-Modified headers.
+
+        With cache_dir the keys are saved on disk too, and reused by other
+        processes and later runs. """
+
+    def __init__(self, ttl=3600, max_keys=128, cache_dir=None, fetch=fetch_url):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+
+    def resolve(self, url):
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                self._entries.move_to_end(url)
+
+        if entry is None and self.cache_dir:
+            entry = self._load(url)
+            if entry:
+                self._store(url, entry)
+
+        if entry is None or entry.expires <= now:
+            entry = self._refresh(url, entry, now)
+
+        return entry.pem, entry.key_type, entry.key
+
+    def _refresh(self, url, entry, now):
+        """ Download the key, or revalidate the one we have """
+
+        headers = {}
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        response = self.fetch(url, headers=headers)
+        expires = now + cache_lifetime(response, self.ttl)
+
+        if response.status == 304 and entry:
+            entry.expires = expires
+        else:
+            record = default_keyring.load_public_key(response.body, url)
+            entry = _KeyEntry(response.body, record.key_type, record.key, expires,
+                              etag=response.get_header('ETag'),
+                              last_modified=response.get_header('Last-Modified'))
+
+        self._store(url, entry)
+        if self.cache_dir:
+            self._save(url, entry)
+
+        return entry
+
+    def _store(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def _file_name(self, url):
+        return os.path.join(self.cache_dir, sha256_string(url.encode('utf-8')).decode('ascii'))
+
+    def _load(self, url):
+        """ Read a key saved on disk, None if there isn't one """
+
+        base = self._file_name(url)
+
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(base + '.pem', 'rb') as f:
+                pem = f.read()
+
+            if meta['url'] != url:
+                return None
+
+            record = default_keyring.load_public_key(pem, url)
+        except (OSError, ValueError, KeyError, UnknownKeyType):
+            return None
+
+        return _KeyEntry(pem, record.key_type, record.key, meta['expires'],
+                         etag=meta.get('etag'),
+                         last_modified=meta.get('last_modified'))
+
+    def _save(self, url, entry):
+        base = self._file_name(url)
+        meta = dict(url=url, expires=entry.expires, etag=entry.etag,
+                    last_modified=entry.last_modified)
+
+        # The PEM first, the metadata says it's complete
+        write_file_atomic(base + '.pem', entry.pem)
+        write_file_atomic(base + '.json', json.dumps(meta).encode('utf-8'))
+
+    def clear(self):
+        """ Forget the keys kept in memory """
+
+        with self._lock:
+            self._entries.clear()
+
+class _RevocationEntry():
+    def __init__(self, revoked, expires, etag=None, last_modified=None):
+        self.revoked = revoked            # Serial number -> Reason
+        self.expires = expires            # Timestamp
+        self.etag = etag
+        self.last_modified = last_modified
+
+class RevocationCache():
+    """ Cache of the revocation lists of the issuers.
+
+        Each list is kept as a dict indexed by serial number, so checking a
+        badge is a lookup. The badge url -> issuer -> revocation list chain
+        and the lists are refreshed every interval seconds, the lists with
+        conditional requests. With interval=0 every check goes to the
+        network, like a verification without cache. """
+
+    def __init__(self, interval=300, fetch=fetch_url):
+        self.interval = interval
+        self.fetch = fetch
+        self._lists = dict()              # Revocation url -> _RevocationEntry
+        self._badges = dict()             # Badge url -> (Revocation url, expires)
+        self._issuers = dict()            # Issuer url -> (Revocation url, expires)
+        self._lock = threading.Lock()
+
+    def check(self, json_url, serial_num):
+        """ Return the revocation reason of a badge, None if not revoked """
+
+        return self.get_revocations(json_url).get(serial_num)
+
+    def get_revocations(self, json_url):
+        """ Return the revocation list of the issuer of a badge, as a dict
+            of serial number -> reason """
+
+        now = time.time()
+        revocation_url = self.get_revocation_url(json_url, now)
+
+        with self._lock:
+            entry = self._lists.get(revocation_url)
+
+        if entry is None or entry.expires <= now:
+            entry = self._refresh(revocation_url, entry, now)
+
+        return entry.revoked
+
+    def get_revocation_url(self, json_url, now=None):
+        """ Follow the badge and issuer json to the revocation list url.
+            The issuer json is read once for all the badges of the issuer """
+
+        now = now or time.time()
+
+        revocation_url = self._cached(self._badges, json_url, now)
+        if revocation_url:
+            return revocation_url
+
+        issuer_url = self._get_field(json_url, 'Badge', 'issuer')
+
+        revocation_url = self._cached(self._issuers, issuer_url, now)
+        if not revocation_url:
+            revocation_url = self._get_field(issuer_url, 'Issuer', 'revocationList')
+            with self._lock:
+                self._issuers[issuer_url] = (revocation_url, now + self.interval)
+
+        with self._lock:
+            self._badges[json_url] = (revocation_url, now + self.interval)
+
+        return revocation_url
+
+    def _cached(self, table, url, now):
+        with self._lock:
+            cached = table.get(url)
+
+        if cached and cached[1] > now:
+            return cached[0]
+
+        return None
+
+    def _get_field(self, url, name, field):
+        try:
+            return self._get_json(url, name)[field]
+        except (KeyError, TypeError):
+            raise AssertionFormatIncorrect('%s JSON without %s at %s' % (name, field, url))
+
+    def _get_json(self, url, name):
+        response = self.fetch(url)
+        if not response.body:
+            raise AssertionFormatIncorrect('%s JSON doesn\'t exists %s' % (name, url))
+        try:
+            return jws_utils.from_json(response.body)
+        except:
+            raise AssertionFormatIncorrect('%s JSON format incorrect at %s' % (name, url))
+
+    def _refresh(self, url, entry, now):
+        headers = {}
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        response = self.fetch(url, headers=headers)
+
+        if response.status == 304 and entry:
+            entry.expires = now + self.interval
+        else:
+            try:
+                revoked = jws_utils.from_json(response.body) or dict()
+            except:
+                raise AssertionFormatIncorrect('Revocation list format incorrect at %s' % url)
+
+            entry = _RevocationEntry(dict(revoked), now + self.interval,
+                                     etag=response.get_header('ETag'),
+                                     last_modified=response.get_header('Last-Modified'))
+
+        with self._lock:
+            self._lists[url] = entry
+
+        return entry
+
+    def clear(self):
+        """ Forget all the revocation lists """
+
+        with self._lock:
+            self._lists.clear()
+            self._badges.clear()
+            self._issuers.clear()
+
+if __name__ == '__main__':
+    pass
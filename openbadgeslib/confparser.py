@@ -22,19 +22,63 @@
 """
 
 import os
+import json
+import hashlib
 import logging
 logger = logging.getLogger(__name__)
 
 from configparser import ConfigParser, ExtendedInterpolation, Error, NoOptionError
 
+from .util import write_file_atomic
+
+SNAPSHOT_VERSION = 1
+
+class ConfSection(dict):
+    """ Section of a ConfSnapshot, named like a configparser SectionProxy """
+
+    def __init__(self, name, values):
+        super().__init__(values)
+        self.name = name
+
+class ConfSnapshot(dict):
+    """ Configuration with its values already resolved, used like the
+        ConfigParser returned by ConfParser.read_conf():
+        conf[section][option]. """
+
+    def __init__(self, sections):
+        super().__init__((name, ConfSection(name, values))
+                         for name, values in sections.items())
+
+    def sections(self):
+        return list(self)
+
 class ConfParser():
-    def __init__(self, config_file='config.ini'):
+    """ Read config.ini.
+
+        With snapshot=True the resolved configuration is saved in a
+        snapshot file next to config.ini, and read from there while
+        config.ini doesn't change, skipping its parsing and interpolation.
+        read_conf() returns then a ConfSnapshot. The snapshot has the
+        passwords of config.ini, it is only readable by its owner. """
+
+    def __init__(self, config_file='config.ini', snapshot=False):
         self.config_file = config_file
+        self.snapshot = snapshot
+
+    def get_snapshot_file(self):
+        directory, name = os.path.split(self.config_file)
+        return os.path.join(directory, '.%s.snapshot' % name)
 
     def read_conf(self):
         if not os.path.isfile(self.config_file):
             return None
 
+        if self.snapshot:
+            return self.read_snapshot()
+
+        return self._parse()
+
+    def _parse(self):
         self.parser = ConfigParser(interpolation=ExtendedInterpolation())
 
         try:
@@ -49,5 +93,64 @@ class ConfParser():
             self.parser['paths']['base'] = full_path
         return self.parser
 
+    def read_snapshot(self):
+        """ Return the configuration from its snapshot, made again if
+            config.ini has changed """
+
+        st = os.stat(self.config_file)
+
+        try:
+            with open(self.get_snapshot_file(), 'rb') as f:
+                snapshot = json.loads(f.read().decode('utf-8'))
+            source = snapshot['config']
+            if (snapshot['version'] != SNAPSHOT_VERSION or
+                    source['path'] != os.path.abspath(self.config_file)):
+                snapshot = None
+        except (OSError, ValueError, KeyError, TypeError):
+            snapshot = None
+
+        if snapshot:
+            if (source['mtime_ns'], source['size']) == (st.st_mtime_ns, st.st_size):
+                return ConfSnapshot(snapshot['sections'])
+
+            # Touched, but maybe not modified
+            with open(self.config_file, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() == source['sha256']:
+                    source.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                    self._save_snapshot(snapshot)
+                    return ConfSnapshot(snapshot['sections'])
+
+        return self._make_snapshot(st)
+
+    def _make_snapshot(self, st):
+        with open(self.config_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        conf = self._parse()
+
+        try:
+            sections = dict((name, dict(conf[name])) for name in conf.sections())
+        except Error as err:
+            # Let the broken option fail when it is used, like without snapshot
+            logger.debug('Config snapshot not made: %s' % err)
+            return conf
+
+        snapshot = dict(version=SNAPSHOT_VERSION,
+                        config=dict(path=os.path.abspath(self.config_file),
+                                    mtime_ns=st.st_mtime_ns, size=st.st_size,
+                                    sha256=digest),
+                        sections=sections)
+        self._save_snapshot(snapshot)
+
+        return ConfSnapshot(snapshot['sections'])
+
+    def _save_snapshot(self, snapshot):
+        try:
+            write_file_atomic(self.get_snapshot_file(),
+                              json.dumps(snapshot).encode('utf-8'))
+        except OSError as err:
+            # A read only directory, the configuration is parsed every time
+            logger.debug('Config snapshot not saved: %s' % err)
+
 if __name__ == '__main__':
     pass
@@ -71,6 +71,9 @@ class ErrorSigningFile(SignerExceptions):
 class BadgeSignedFileExists(SignerExceptions):
     pass
 
+class RecipientsFileError(SignerExceptions):
+    pass
+
 """ Verifier Exceptions """
 
 class PayloadFormatIncorrect(VerifierExceptions):
@@ -88,6 +91,9 @@ class NoPubKeySpecified(VerifierExceptions):
 class ErrorParsingFile(VerifierExceptions):
     pass
 
+class VerifyKeyUnavailable(VerifierExceptions):
+    pass
+
 """ Badge Object Exceptios """
 
 class BadgeNotExists(LibOpenBadgesException):
@@ -96,3 +102,6 @@ class BadgeNotExists(LibOpenBadgesException):
 class BadgeImgFormatUnsupported(LibOpenBadgesException):
     pass
 
+class BadgeImgFormatIncorrect(LibOpenBadgesException):
+    pass
+
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from Crypto.PublicKey import RSA
+from ecdsa import SigningKey, VerifyingKey, ellipticcurve
+
+from .errors import UnknownKeyType
+from .keys import KeyType, load_public_key
+from .util import sha256_string
+
+class KeyRecord():
+    """ A key parsed from PEM """
+
+    def __init__(self, pem=None, key_type=None, key=None, fingerprint=None,
+                 private=False):
+        self.pem = pem
+        self.key_type = key_type
+        self.key = key                      # crypto Object
+        self.fingerprint = fingerprint      # SHA-256 of the public key, hex
+        self.private = private
+
+    def __str__(self):
+        return 'Key Type: %s\nFingerprint: %s\nPrivate: %s\n' % (self.key_type, self.fingerprint, self.private)
+
+def _public_der(key_type, key):
+    if key_type is KeyType.RSA:
+        return key.publickey().exportKey('DER')
+    if isinstance(key, SigningKey):
+        return key.get_verifying_key().to_der()
+    return key.to_der()
+
+def _load_private_key(pem_data):
+    try:
+        return KeyType.RSA, RSA.importKey(pem_data)
+    except:
+        pass
+
+    try:
+        return KeyType.ECC, SigningKey.from_pem(pem_data)
+    except:
+        pass
+
+    raise UnknownKeyType('Unable to guess Key type')
+
+class Keyring():
+    """ Keys parsed once per process.
+
+        Every PEM is parsed a single time into a KeyRecord, with its type
+        detected in the same pass, and the records are indexed by PEM, by
+        fingerprint and by the verify urls they were found at. The private
+        and public records of a key pair have the same fingerprint. The
+        least recently used keys are forgotten after max_keys.
+
+        Besides, the max_precomputed most recently used ECC public keys can
+        be kept with precomputed point multiplication tables, see
+        get_precomputed(). """
+
+    def __init__(self, max_keys=256, max_precomputed=16):
+        self.max_keys = max_keys
+        self.max_precomputed = max_precomputed
+        self._records = OrderedDict()       # (PEM, private) -> KeyRecord
+        self._fingerprints = dict()         # Fingerprint -> Public KeyRecord
+        self._urls = dict()                 # Url -> KeyRecord
+        self._precomputed = OrderedDict()   # Fingerprint -> VerifyingKey
+        self._lock = threading.Lock()
+
+    def load_public_key(self, pem, url=None):
+        """ Return the KeyRecord of a public key in PEM format, parsing it
+            the first time. url is the verify url the key comes from """
+
+        record = self._load(pem, False, load_public_key)
+
+        if url:
+            with self._lock:
+                self._urls[url] = record
+
+        return record
+
+    def load_private_key(self, pem):
+        """ Return the KeyRecord of a private key in PEM format """
+
+        return self._load(pem, True, _load_private_key)
+
+    def _load(self, pem, private, parse):
+        with self._lock:
+            record = self._records.get((pem, private))
+            if record:
+                self._records.move_to_end((pem, private))
+                return record
+
+        key_type, key = parse(pem)
+        fingerprint = sha256_string(_public_der(key_type, key)).decode('latin-1')
+        record = KeyRecord(pem, key_type, key, fingerprint, private)
+
+        with self._lock:
+            self._records[(pem, private)] = record
+            if not private:
+                self._fingerprints[fingerprint] = record
+
+            while len(self._records) > self.max_keys:
+                (old_pem, old_private), old = self._records.popitem(last=False)
+                if self._fingerprints.get(old.fingerprint) is old:
+                    del self._fingerprints[old.fingerprint]
+                for url in [u for u, r in self._urls.items() if r is old]:
+                    del self._urls[url]
+
+        return record
+
+    def get_precomputed(self, pem):
+        """ Return the crypto object of a public key for verifying. For
+            ECC keys it's a VerifyingKey with precomputed tables, making
+            every verification faster, kept in a LRU of max_precomputed
+            keys. Other keys, or an ecdsa without precomputation, give the
+            key of the KeyRecord. """
+
+        record = self.load_public_key(pem)
+
+        if (record.key_type is not KeyType.ECC or not self.max_precomputed
+                or not hasattr(ellipticcurve, 'PointJacobi')):
+            return record.key
+
+        with self._lock:
+            key = self._precomputed.get(record.fingerprint)
+            if key:
+                self._precomputed.move_to_end(record.fingerprint)
+                return key
+
+        # A copy, the tables are freed when it leaves the LRU. The point is
+        # created with the curve order, needed for the tables, which the
+        # points of keys read from PEM don't always have.
+        curve = record.key.curve
+        point = record.key.pubkey.point
+        point = ellipticcurve.PointJacobi(curve.curve, point.x(), point.y(), 1,
+                                          curve.order, generator=True)
+        key = VerifyingKey.from_public_point(point, curve=curve)
+        point * 2                           # Build the tables now
+
+        with self._lock:
+            self._precomputed[record.fingerprint] = key
+            while len(self._precomputed) > self.max_precomputed:
+                self._precomputed.popitem(last=False)
+
+        return key
+
+    def get(self, fingerprint):
+        """ Return the public KeyRecord with that fingerprint, or None """
+
+        with self._lock:
+            return self._fingerprints.get(fingerprint)
+
+    def get_by_url(self, url):
+        """ Return the KeyRecord found at a verify url, or None """
+
+        with self._lock:
+            return self._urls.get(url)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._fingerprints.clear()
+            self._urls.clear()
+            self._precomputed.clear()
+
+default_keyring = Keyring()
+
+if __name__ == '__main__':
+    pass
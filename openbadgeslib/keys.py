@@ -26,6 +26,7 @@ logger = logging.getLogger(__name__)
 
 import os
 import sys
+import time
 
 from enum import Enum
 from Crypto.PublicKey import RSA
@@ -34,6 +35,7 @@ from ecdsa import SigningKey, VerifyingKey, NIST256p
 from .errors import UnknownKeyType, PrivateKeySaveError, \
         PublicKeySaveError, GenPrivateKeyError, \
         GenPublicKeyError, PrivateKeyReadError, PublicKeyReadError
+from .util import write_file_atomic
 
 class KeyType(Enum):
     RSA = 'RSA 2048'
@@ -126,19 +128,54 @@ class KeyECC(KeyBase):
     def get_pub_key_pem(self):
         return self.pub_key.to_pem()
 
-def detect_key_type(pem_data):
-    """ Positive Key type detection """
+def generate_key_files(private_key, public_key, key_type=KeyType.RSA):
+    """ Generate a key pair and save it at the given paths, returning the
+        seconds spent. The files are written atomically, a key file is
+        never seen half written, and existing ones are not replaced. """
+
+    if os.path.exists(private_key):
+        raise PrivateKeySaveError('Key file is present at %s' % private_key)
+    if os.path.exists(public_key):
+        raise PublicKeySaveError('Key file is present at %s' % public_key)
+
+    start = time.perf_counter()
+    priv_key_pem, pub_key_pem = KeyFactory(key_type).generate_keypair()
+    elapsed = time.perf_counter() - start
+
+    # The private key first: without it the public one is useless
+    try:
+        write_file_atomic(private_key, priv_key_pem, replace=False)
+    except FileExistsError:
+        raise PrivateKeySaveError('Key file is present at %s' % private_key)
+    except OSError as err:
+        raise PrivateKeySaveError('Error saving %s: %s' % (private_key, err))
+
+    try:
+        write_file_atomic(public_key, pub_key_pem, replace=False, mode=0o644)
+    except FileExistsError:
+        raise PublicKeySaveError('Key file is present at %s' % public_key)
+    except OSError as err:
+        raise PublicKeySaveError('Error saving %s: %s' % (public_key, err))
+
+    return elapsed
+
+def load_public_key(pem_data):
+    """ Parse a public key in PEM format, returning its type and the crypto
+        object """
 
     try:
-        RSA.importKey(pem_data)
-        return KeyType.RSA
+        return KeyType.RSA, RSA.importKey(pem_data)
     except:
         pass
 
     try:
-        VerifyingKey.from_pem(pem_data)
-        return KeyType.ECC
+        return KeyType.ECC, VerifyingKey.from_pem(pem_data)
     except:
         pass
 
     raise UnknownKeyType('Unable to guess Key type')
+
+def detect_key_type(pem_data):
+    """ Positive Key type detection """
+
+    return load_public_key(pem_data)[0]
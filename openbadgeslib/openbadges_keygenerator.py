@@ -29,70 +29,137 @@
     POSSIBILITY OF SUCH DAMAGE.
 """
 
-import argparse, os.path, sys
+import argparse, os, os.path, sys, time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from .logs import Logger
-from .keys import KeyFactory
+from .keys import generate_key_files
 from .errors import KeyGenExceptions
 from .confparser import ConfParser
 from .util import __version__
 global log
 
+def find_missing_keys(conf):
+    """ Return the (badge, private_key, public_key) of the badges of the
+        configuration without key files, and the badges with only one of
+        them, that are left alone. The badges sharing the key files of
+        a previous one are not returned, the key pair is generated once. """
+
+    missing, partial = [], []
+    seen = set()
+
+    for badge in conf.sections():
+        if not badge.startswith('badge_'):
+            continue
+
+        private_key = conf[badge]['private_key']
+        public_key = conf[badge]['public_key']
+        present = [os.path.exists(i) for i in (private_key, public_key)]
+
+        if not any(present):
+            if (private_key, public_key) not in seen:
+                seen.add((private_key, public_key))
+                missing.append((badge, private_key, public_key))
+        elif not all(present):
+            partial.append(badge)
+
+    return missing, partial
+
+def generate_all(log, conf, jobs=None):
+    """ Generate the key pairs of all the badges without key files, in a
+        pool of processes. Return the number of key pairs not generated. """
+
+    missing, partial = find_missing_keys(conf)
+
+    for badge in partial:
+        log.console.warning('%s has only one of its key files, skipping it' % badge)
+
+    if not missing:
+        log.console.info('All the badges have a key pair')
+        return len(partial)
+
+    log.console.info("Generating %d key pairs for issuer '%s'"
+                     % (len(missing), conf['issuer']['name']))
+
+    generated = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = dict((pool.submit(generate_key_files, private_key, public_key), badge)
+                       for badge, private_key, public_key in missing)
+
+        for future in as_completed(futures):
+            badge = futures[future]
+            try:
+                log.console.info('Key pair of %s generated in %.2f seconds'
+                                 % (badge, future.result()))
+                generated += 1
+            except KeyGenExceptions as err:
+                log.console.error('%s: %s' % (badge, err))
+
+    log.console.info('%d key pairs generated in %.2f seconds'
+                     % (generated, time.perf_counter() - start))
+
+    return len(missing) - generated + len(partial)
+
 # Entry Point
 def main():
     parser = argparse.ArgumentParser(description='Key Generation Parameters')
     parser.add_argument('-c', '--config', default='config.ini',
             help='Specify the config.ini file to use')
-    parser.add_argument('-g', '--genkey', metavar='BADGE',
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('-g', '--genkey', metavar='BADGE',
             help=('Generate a new Key pair '
                 'for the specified Badge. Key type is taken from profile.'))
+    mode.add_argument('-a', '--all', action='store_true',
+            help='Generate a new Key pair for every Badge without key files.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+            help='Number of processes generating keys in parallel with --all.')
     parser.add_argument('-v', '--version', action='version',
             version=__version__ )
     args = parser.parse_args()
 
-    if not args.genkey:
+    if args.jobs is not None and args.jobs < 1:
+        sys.exit('The number of jobs must be greater than zero')
+
+    if not (args.genkey or args.all):
         parser.print_help()
     else:
         cparser = ConfParser(args.config)
         conf = cparser.read_conf()
 
-        badge = 'badge_' + args.genkey
-        if conf:
-            if badge not in conf :
-                sys.exit("Badge '%s' doesn't exist in the configuration file"
-                        %args.genkey)
-            private_key = conf[badge]['private_key']
-            public_key = conf[badge]['public_key']
-
-            for i in (private_key, public_key) :
-                if os.path.exists(i):
-                    print('[!] Key file is present at %s' % i)
-                    sys.exit(1)
-
-            log = Logger(base_log=conf['paths']['base_log'],
-                      general=conf['logs']['general'],
-                      signer=conf['logs']['signer'])
+        if not conf:
+            print('ERROR: Config file %s NOT exists or is empty' % args.config)
+            return
 
-            try:
-                log.console.info("Generating key pair for issuer '%s'" % conf['issuer']['name'])
+        log = Logger(base_log=conf['paths']['base_log'],
+                  general=conf['logs']['general'],
+                  signer=conf['logs']['signer'])
+
+        if args.all:
+            if generate_all(log, conf, args.jobs):
+                sys.exit(1)
+            return
 
-                kf = KeyFactory()
-                priv_key_pem, pub_key_pem = kf.generate_keypair()
+        badge = 'badge_' + args.genkey
+        if badge not in conf :
+            sys.exit("Badge '%s' doesn't exist in the configuration file"
+                    %args.genkey)
+        private_key = conf[badge]['private_key']
+        public_key = conf[badge]['public_key']
 
-                with open(private_key, 'wb') as f:
-                    f.write(priv_key_pem)
+        for i in (private_key, public_key) :
+            if os.path.exists(i):
+                print('[!] Key file is present at %s' % i)
+                sys.exit(1)
 
-                with open(public_key, 'wb') as f:
-                    f.write(pub_key_pem)
+        log.console.info("Generating key pair for issuer '%s'" % conf['issuer']['name'])
 
-                log.console.info('Private key saved at: %s' % private_key)
-                log.console.info('Public key saved at: %s' % public_key)
+        generate_key_files(private_key, public_key)
 
-            except KeyGenExceptions:
-                raise
-        else:
-            print('ERROR: Config file %s NOT exists or is empty' % args.config)
+        log.console.info('Private key saved at: %s' % private_key)
+        log.console.info('Public key saved at: %s' % public_key)
 
 if __name__ == '__main__':
     main()
-
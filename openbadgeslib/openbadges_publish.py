@@ -77,7 +77,7 @@ def main():
                     f.write(create_badge_json(conf, badge_name))
 
                 """ Copy the verify keys """
-                source = conf['keys']['public']
+                source = conf[badge_name]['public_key']
                 destination = os.path.join(badge_path, 'verify.pem')
                 shutil.copyfile(source, destination)
 
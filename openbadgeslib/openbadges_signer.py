@@ -37,18 +37,73 @@ from datetime import datetime
 from .logs import Logger
 from .keys import KeyType, detect_key_type
 from .signer import Signer
+from .recipients import Recipient, read_recipients_file
 from .errors import LibOpenBadgesException, SignerExceptions
 from .confparser import ConfParser
 from .badge import Badge, BadgeImgType, BadgeType
 from .mail import BadgeMail
 from .util import __version__
 
+def badge_file_name(badge, badge_obj, receptor):
+    """ Name of the file where the badge signed for a receptor is saved """
+
+    if badge_obj.image_type is BadgeImgType.PNG:
+        return '%s_%s.png' % (badge, receptor)
+    elif badge_obj.image_type is BadgeImgType.SVG:
+        return '%s_%s.svg' % (badge, receptor)
+
+def pending_recipients(recipients, badge, badge_obj, output, skipped):
+    """ Yield the recipients without a badge already signed in the output
+        directory, once. The others are added to skipped """
+
+    seen = set()
+
+    for recipient in recipients:
+        identity = recipient.get_identity()
+        badge_file_out = os.path.join(output, badge_file_name(badge, badge_obj, identity))
+
+        if identity in seen:
+            print('%s is repeated in the recipients file, skipping it' % identity)
+            skipped.append(recipient)
+        elif os.path.isfile(badge_file_out):
+            print('A %s OpenBadge has already signed for %s in %s' % (badge, identity, badge_file_out))
+            skipped.append(recipient)
+        else:
+            seen.add(identity)
+            yield recipient
+
+def create_mailer(conf, badge):
+    """ Create a BadgeMail object from the SMTP settings of config.ini """
+
+    server = conf['smtp']['smtp_server']
+    port = conf['smtp']['smtp_port']
+    use_ssl = conf['smtp']['use_ssl']
+    mail_from = conf['smtp']['mail_from']
+    username = None
+    password = None
+
+    if 'username' in conf['smtp']:
+        username = conf['smtp']['username']
+
+    if 'password' in conf['smtp']:
+        password = conf['smtp']['password']
+
+    mail = BadgeMail(server, port, use_ssl, mail_from, username,
+                     password)
+    subject, body = mail.get_mail_content(conf[badge]['mail'])
+    mail.set_subject(subject)
+    mail.set_body(body)
+    return mail
+
 # Entry Point
 def main():
     parser = argparse.ArgumentParser(description='Badge Signer Parameters')
     parser.add_argument('-c', '--config', default='config.ini', help='Specify the config.ini file to use')
     parser.add_argument('-b', '--badge', required=True, help='Specify the badge name for sign')
-    parser.add_argument('-r', '--receptor', required=True, help='Specify the receptor email of the badge')
+    receptors = parser.add_mutually_exclusive_group(required=True)
+    receptors.add_argument('-r', '--receptor', help='Specify the receptor email of the badge')
+    receptors.add_argument('-f', '--recipients-file', help='Sign the badge for every receptor in a CSV or JSONL file')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes signing badges in parallel.')
     parser.add_argument('-o', '--output', default=os.path.curdir, help='Specify the output directory to save the badge.')
     parser.add_argument('-M', '--mail-badge', action='store_true', help='Send Badge to user mail')
     parser.add_argument('-e', '--evidence', help='Set an URL to the user evidence')
@@ -63,13 +118,16 @@ def main():
 
     evidence = args.evidence  # If no evidence, evidence=None
 
+    if args.jobs < 1:
+        sys.exit('The number of jobs must be greater than zero')
+
     if args.expires:
         expiration = int(time.time()) + args.expires*86400
     else:
         expiration = None
 
     if args.badge:
-        cf = ConfParser(args.config)
+        cf = ConfParser(args.config, snapshot=True)
         conf = cf.read_conf()
 
         badge = 'badge_' + args.badge
@@ -83,62 +141,67 @@ def main():
             sys.exit(-1)
 
         try:
-            sf = Signer(identity=args.receptor.encode('utf-8'), evidence=evidence,
-                        expiration=expiration, badge_type=BadgeType.SIGNED)
+            sf = Signer(evidence=evidence, expiration=expiration,
+                        badge_type=BadgeType.SIGNED)
 
             badge_obj = Badge.create_from_conf(conf, badge)
 
-            if badge_obj.image_type is BadgeImgType.PNG:
-                fbase = '%s_%s.png' % (badge, args.receptor)
-            elif badge_obj.image_type is BadgeImgType.SVG:
-                fbase = '%s_%s.svg' % (badge, args.receptor)
+            if args.recipients_file:
+                if not os.path.isfile(args.recipients_file):
+                    print('ERROR: The recipients file %s NOT exists' % args.recipients_file)
+                    sys.exit(-1)
 
-            badge_file_out = os.path.join(args.output, fbase)
+                recipients = read_recipients_file(args.recipients_file,
+                                                  evidence=evidence,
+                                                  expiration=expiration)
+            else:
+                recipients = [Recipient(identity=args.receptor,
+                                        evidence=evidence,
+                                        expiration=expiration)]
 
-            if os.path.isfile(badge_file_out):
-                print('A %s OpenBadge has already signed for %s in %s' % (args.badge, args.receptor, badge_file_out))
-                sys.exit(-1)
+                badge_file_out = os.path.join(args.output,
+                                  badge_file_name(badge, badge_obj, args.receptor))
+
+                if os.path.isfile(badge_file_out):
+                    print('A %s OpenBadge has already signed for %s in %s' % (args.badge, args.receptor, badge_file_out))
+                    sys.exit(-1)
 
             # Checking url reachability..
             if badge_obj.urls_has_problems():
                 sys.exit(-1)
 
-            badge_signed = sf.sign_badge(badge_obj)
-
-            if badge_signed:
-                sign_log = os.path.join(conf['paths']['base_log'], conf['logs']['signer'])
-                # Date in ISO-8601 Format
-                msg = '%s %s SIGNED for %s UID %s\n' \
-                    % (datetime.today().isoformat(), badge,
-                       badge_signed.get_identity(), badge_signed.get_serial_num())
-
-                with open(sign_log, 'w') as file:
-                    file.write(msg)
-
-                badge_signed.save_to_file(badge_file_out)
-
-                if bool(args.mail_badge):
-                    server = conf['smtp']['smtp_server']
-                    port = conf['smtp']['smtp_port']
-                    use_ssl = conf['smtp']['use_ssl']
-                    mail_from = conf['smtp']['mail_from']
-                    login = None
-                    password = None
-
-                    if 'username' in conf['smtp']:
-                        username = conf['smtp']['username']
-
-                    if 'password' in conf['smtp']:
-                        password = conf['smtp']['password']
-
-                    mail = BadgeMail(server, port, use_ssl, mail_from, username,
-                                     password)
-                    subject, body = mail.get_mail_content(conf[badge]['mail'])
-                    mail.set_subject(subject)
-                    mail.set_body(body)
-                    mail.send(badge_signed)
-                    
-                print('%s at: %s' % (msg.strip('\n'), badge_file_out))
+            mail = create_mailer(conf, badge) if args.mail_badge else None
+            sign_log = os.path.join(conf['paths']['base_log'], conf['logs']['signer'])
+            skipped = []
+
+            signed = 0
+            start = time.time()
+
+            with open(sign_log, 'a') as log:
+                pending = pending_recipients(recipients, badge, badge_obj,
+                                             args.output, skipped)
+                for badge_signed in sf.sign_many(badge_obj, pending, jobs=args.jobs):
+                    badge_file_out = os.path.join(args.output,
+                        badge_file_name(badge, badge_obj, badge_signed.get_identity()))
+
+                    # Date in ISO-8601 Format
+                    msg = '%s %s SIGNED for %s UID %s\n' \
+                        % (datetime.today().isoformat(), badge,
+                           badge_signed.get_identity(), badge_signed.get_serial_num())
+
+                    log.write(msg)
+                    badge_signed.save_to_file(badge_file_out)
+
+                    if mail:
+                        mail.send(badge_signed)
+
+                    print('%s at: %s' % (msg.strip('\n'), badge_file_out))
+                    signed += 1
+
+            if args.recipients_file:
+                elapsed = time.time() - start
+                print('%d badges signed, %d skipped in %.2f seconds (%.1f badges/s)'
+                      % (signed, len(skipped), elapsed, signed / elapsed if elapsed else 0))
 
         except SignerExceptions:
             raise
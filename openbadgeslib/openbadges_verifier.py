@@ -36,7 +36,9 @@ from .verifier import Verifier
 from .errors import LibOpenBadgesException, VerifierExceptions
 from .confparser import ConfParser
 from .badge import BadgeSigned, BadgeStatus
-from .util import __version__
+from .bundle import TrustBundle
+from .cache import HttpCache, RevocationCache
+from .util import __version__, default_fetcher
 
 # Entry Point
 def main():
@@ -51,13 +53,17 @@ def main():
             help='Do the verification using the local configuration')
     parser.add_argument('-s', '--show', action='store_true', 
             help='Show the assertion of the OpenBadge being verified.')
+    parser.add_argument('--cache', metavar='DIR',
+            help='Keep the files downloaded from the issuers in this directory')
+    parser.add_argument('--offline', metavar='DIR',
+            help='Verify without network, with the issuer files published in this directory')
     parser.add_argument('-v', '--version', action='version',
             version=__version__ )
     args = parser.parse_args()
 
     if args.filein and args.receptor:
         if args.local:
-            cf = ConfParser(args.config)
+            cf = ConfParser(args.config, snapshot=True)
        	    conf = cf.read_conf()
             if not conf:
                 print('[!] The config file %s NOT exists or is empty' % args.config)
@@ -69,21 +75,33 @@ def main():
             if not os.path.isfile(args.filein):
                 print('[!] Badge file %s NOT exists.' % args.filein)
                 sys.exit(-1)
-            
-            badge = BadgeSigned.read_from_file(args.filein)
 
             if args.local:
                 badge_name = 'badge_' + args.local
                 if badge_name not in conf :
                     sys.exit('There is no "%s" badge in the configuration' %
                             args.local)
-              
+
                 with open(conf[badge_name]['public_key'], 'rb') as file:
                     local_pubkey = file.read()
+
+            if args.cache:
+                default_fetcher.cache = HttpCache(args.cache)
+
+            if args.offline:
+                if not os.path.isdir(args.offline):
+                    print('[!] Trust bundle %s NOT exists.' % args.offline)
+                    sys.exit(-1)
+
+                bundle = TrustBundle(args.offline)
+                badge = BadgeSigned.read_from_file(args.filein, key_resolver=bundle)
+                v = Verifier(verify_key=local_pubkey, identity=args.receptor,
+                             key_resolver=bundle,
+                             revocation_cache=RevocationCache(fetch=bundle.fetch))
             else:
-                local_pubkey = badge.get_signkey_pem()
+                badge = BadgeSigned.read_from_file(args.filein)
+                v = Verifier(verify_key=local_pubkey, identity=args.receptor)
 
-            v = Verifier(verify_key=local_pubkey, identity=args.receptor)
             if args.show:
                 v.print_payload(badge)
                 
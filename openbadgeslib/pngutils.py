@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+from struct import pack, unpack_from
+from zlib import crc32, decompress, error as ZlibError
+
+from .errors import BadgeImgFormatIncorrect
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def iter_chunks(data):
+    """ Walk the chunks of a PNG image reading only the chunk headers.
+
+        Yield a (tag, offset, length) tuple per chunk, where offset is the
+        position of the chunk in data and length the size of its payload.
+        The chunk payloads and CRCs are not read. data can be any object
+        supporting slicing and the buffer protocol (bytes, memoryview,
+        mmap...) """
+
+    if bytes(data[:8]) != PNG_SIGNATURE:
+        raise BadgeImgFormatIncorrect('The image is not a PNG file')
+
+    offset = len(PNG_SIGNATURE)
+    size = len(data)
+
+    while offset + 8 <= size:
+        length, tag = unpack_from('!I4s', data, offset)
+        if offset + 12 + length > size:
+            break
+
+        yield tag, offset, length
+
+        if tag == b'IEND':
+            return
+        offset += 12 + length
+
+    raise BadgeImgFormatIncorrect('The PNG file is truncated')
+
+def find_chunk(data, tag):
+    """ Return the offset of the first chunk with that tag, or None """
+
+    for chunk_tag, offset, length in iter_chunks(data):
+        if chunk_tag == tag:
+            return offset
+
+    return None
+
+def find_itxt(data, keyword):
+    """ Return the text of the first iTXt chunk with that keyword, or None.
+
+        Only the headers of the chunks are read while looking for it, the
+        payload of the other chunks (IDAT...) is skipped. """
+
+    key = keyword + b'\x00'
+
+    for tag, offset, length in iter_chunks(data):
+        if tag != b'iTXt' or length < len(key) + 4:
+            continue
+
+        start = offset + 8
+        if bytes(data[start:start+len(key)]) != key:
+            continue
+
+        # compression flag, compression method, language\0, translated keyword\0, text
+        payload = bytes(data[start+len(key):start+length])
+        try:
+            language_end = payload.index(b'\x00', 2)
+            text_start = payload.index(b'\x00', language_end + 1) + 1
+            if payload[0]:
+                return decompress(payload[text_start:])
+            return payload[text_start:]
+        except (ValueError, ZlibError):
+            raise BadgeImgFormatIncorrect('Malformed iTXt chunk %s' % keyword)
+
+    return None
+
+def make_chunk(tag, data):
+    """ Return a complete PNG chunk, with its length and CRC """
+
+    checksum = crc32(data, crc32(tag)) & 0xffffffff
+    return pack('!I', len(data)) + tag + data + pack('!I', checksum)
+
+if __name__ == '__main__':
+    pass
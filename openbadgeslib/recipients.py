@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import csv
+import json
+import time
+
+from .errors import RecipientsFileError
+
+class Recipient():
+    """ A receptor of a badge in a bulk signing run """
+
+    def __init__(self, identity=None, evidence=None, expiration=None):
+        if isinstance(identity, str):
+            identity = identity.encode('utf-8')
+
+        self.identity = identity              # Binary e-mail
+        self.evidence = evidence              # Url or None
+        self.expiration = expiration          # Timestamp or None
+
+    def get_identity(self):
+        return self.identity.decode('utf-8')
+
+    def __str__(self):
+        return 'Identity: %s\nEvidence: %s\nExpiration: %s\n' % (self.identity, self.evidence, self.expiration)
+
+def _expiration_from_days(days):
+    """ Convert a number of days from now into a timestamp """
+
+    if days in (None, ''):
+        return None
+
+    return int(time.time()) + int(days)*86400
+
+def _create_recipient(row, evidence, expiration, num, file_name):
+    identity = row.get('identity') or ''
+    if not isinstance(identity, str):
+        raise RecipientsFileError('Line %d of %s has an identity that is not a string' % (num, file_name))
+
+    identity = identity.strip()
+    if not identity:
+        raise RecipientsFileError('Line %d of %s has a recipient without identity' % (num, file_name))
+
+    if row.get('evidence'):
+        evidence = row['evidence'].strip()
+
+    if row.get('expires') not in (None, ''):
+        try:
+            expiration = _expiration_from_days(row['expires'])
+        except ValueError:
+            raise RecipientsFileError('Line %d of %s has an invalid expires value: %s'
+                                      % (num, file_name, row['expires']))
+
+    return Recipient(identity=identity, evidence=evidence,
+                     expiration=expiration)
+
+def read_recipients_file(file_name, evidence=None, expiration=None):
+    """ Yield a Recipient for every entry of a CSV or JSONL file.
+
+        CSV lines are 'identity[,evidence[,expires]]', with an optional
+        header. JSONL lines are objects with the same keys. 'expires' is
+        given in days, like the -x parameter of the signer. Missing values
+        take the evidence and expiration passed as parameters. """
+
+    with open(file_name, 'r', encoding='utf-8-sig', newline='') as f:
+        if file_name.lower().endswith(('.jsonl', '.json')):
+            for num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise RecipientsFileError('Line %d of %s is not valid JSON' % (num, file_name))
+
+                if not isinstance(row, dict):
+                    raise RecipientsFileError('Line %d of %s is not a JSON object' % (num, file_name))
+
+                if 'expires' in row and row['expires'] is not None:
+                    row['expires'] = str(row['expires'])
+
+                yield _create_recipient(row, evidence, expiration, num, file_name)
+        else:
+            fields = ('identity', 'evidence', 'expires')
+
+            for num, values in enumerate(csv.reader(f), 1):
+                if not values or not ''.join(values).strip():
+                    continue
+                if num == 1 and values[0].strip().lower() == 'identity':
+                    continue          # Header line
+                if len(values) > len(fields):
+                    raise RecipientsFileError('Line %d of %s has too many fields' % (num, file_name))
+
+                yield _create_recipient(dict(zip(fields, values)), evidence,
+                                        expiration, num, file_name)
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+from .keyring import default_keyring
+from .util import download_file
+
+class KeyResolver():
+    """ Base class of the verify key resolvers.
+
+        A resolver gives the public key pointed by the verify url of an
+        assertion. Signed badges call it only when the key is needed. """
+
+    def resolve(self, url):
+        """ Return a (pem, key_type, key) tuple for the verify url """
+        raise NotImplementedError()
+
+class DownloadKeyResolver(KeyResolver):
+    """ Download the verify key from the issuer """
+
+    def __init__(self, download=download_file):
+        self.download = download
+
+    def resolve(self, url):
+        pem = self.download(url)
+        record = default_keyring.load_public_key(pem, url)
+        return pem, record.key_type, record.key
+
+class LocalKeyResolver(KeyResolver):
+    """ Resolve every verify url to the same local key """
+
+    def __init__(self, pem):
+        self.pem = pem
+        record = default_keyring.load_public_key(pem)
+        self.key_type, self.key = record.key_type, record.key
+
+    def resolve(self, url):
+        return self.pem, self.key_type, self.key
+
+if __name__ == '__main__':
+    pass
@@ -26,50 +26,186 @@ import sys
 import time
 import json
 
-from struct import pack
-from datetime import datetime
-from xml.dom.minidom import parse, parseString
-from zlib import crc32
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-from png import Reader, write_chunks, _signature
+from datetime import datetime
 
 from .errors import UnknownKeyType, FileToSignNotExists, BadgeSignedFileExists, ErrorSigningFile, PrivateKeyReadError
 from .util import md5_string, sha1_string, sha256_string, __version__
 from .keys import KeyFactory, KeyType
-from .badge import BadgeSigned, BadgeType, BadgeImgType, Assertion
+from .badge import Badge, BadgeSigned, BadgeType, BadgeImgType, Assertion
+from .recipients import Recipient
+from .templates import PngBadgeTemplate, SvgBadgeTemplate, render_svg_dom
 
 
-from .jws import sign as jws_sign
+from .jws import algos
+from .jws import utils as jws_utils
+from .jws.exceptions import MissingKey
 
 class Signer():
+    BATCH_SIZE = 64                 # Assertions signed at once by sign_many
+    WORKER_BATCH_SIZE = 16          # The same, in every worker process
+
     def __init__(self, identity=None, evidence=None, expiration=None,
-                 deterministic=False, badge_type=None):
+                 deterministic=False, badge_type=None, validate=False):
         self.identity = identity
         self.evidence = evidence
         self.expiration = expiration
         self.badge_type = badge_type
         self.deterministic = deterministic
+        self.validate = validate        # Check SVG templates against DOM
 
     def generate_uid(self):
         return sha1_string(os.urandom(128))
 
     def sign_badge(self, badge_obj):
-        if (self.has_assertion(badge_obj)):
+        template = self.create_template(badge_obj)
+
+        if (self.has_assertion(badge_obj, template)):
             raise ErrorSigningFile('The input file is already signed.')
 
+        return self._sign(badge_obj, template, self.identity, self.evidence,
+                          self.expiration)
+
+    def sign_many(self, badge_obj, recipients, jobs=1):
+        """ Sign a Badge for every recipient, returning an iterator of
+            BadgeSigned objects. The recipients can be Recipient objects or
+            plain identities, these take the Signer evidence and expiration.
+
+            The badge and its private key are loaded only once, and the
+            signed badges are generated one by one as they are consumed.
+            With jobs > 1 the signatures are done by a pool of processes,
+            the results keep the order of the recipients. """
+
+        template = self.create_template(badge_obj)
+
+        if (self.has_assertion(badge_obj, template)):
+            raise ErrorSigningFile('The input file is already signed.')
+
+        if jobs > 1:
+            return self._sign_parallel(badge_obj, self._recipients(recipients),
+                                       jobs)
+
+        return self._sign_iter(badge_obj, template,
+                               self._recipients(recipients))
+
+    def create_template(self, badge_obj):
+        """ Parse the badge image once, returning a template to embed
+            assertions in it """
+
+        if badge_obj.image_type is BadgeImgType.SVG:
+            return SvgBadgeTemplate(badge_obj.image, validate=self.validate)
+        elif badge_obj.image_type is BadgeImgType.PNG:
+            return PngBadgeTemplate(badge_obj.image)
+
+    def _recipients(self, recipients):
+        for recipient in recipients:
+            if not isinstance(recipient, Recipient):
+                recipient = Recipient(identity=recipient,
+                                      evidence=self.evidence,
+                                      expiration=self.expiration)
+            yield recipient
+
+    def _sign_iter(self, badge_obj, template, recipients):
+        batch = []
+        for recipient in recipients:
+            batch.append(recipient)
+            if len(batch) >= self.BATCH_SIZE:
+                yield from self._sign_batch(badge_obj, template, batch)
+                batch = []
+
+        yield from self._sign_batch(badge_obj, template, batch)
+
+    def _sign_batch(self, badge_obj, template, recipients):
+        """ Sign a badge for a list of recipients, returning a list of
+            BadgeSigned objects """
+
+        badges = [self._new_badge(badge_obj, recipient.identity,
+                                  recipient.evidence, recipient.expiration)
+                  for recipient in recipients]
+
+        self.generate_assertions(badges)
+
+        for out in badges:
+            out.signed = template.render(out.assertion.get_assertion())
+
+        return badges
+
+    def _sign_parallel(self, badge_obj, recipients, jobs):
+        signer_params = dict(deterministic=self.deterministic,
+                             badge_type=self.badge_type,
+                             validate=self.validate)
+        badge_params = dict(ini_name=badge_obj.ini_name,
+                            image_type=badge_obj.image_type,
+                            image=badge_obj.image,
+                            image_url=badge_obj.image_url,
+                            json_url=badge_obj.json_url,
+                            verify_key_url=badge_obj.verify_key_url,
+                            key_type=badge_obj.key_type,
+                            privkey_pem=badge_obj.privkey_pem)
+
+        # Tagged to not be confused with the ones of other runs
+        params = (os.urandom(16), signer_params, badge_params)
+
+        if sys.version_info >= (3, 7):
+            # Loaded once by every worker when it starts
+            pool = ProcessPoolExecutor(max_workers=jobs, initializer=_load_worker,
+                                       initargs=(params,))
+            batch_params = None
+        else:
+            # Without pool initializer, they go with every batch and the
+            # workers load them on their first one
+            pool = ProcessPoolExecutor(max_workers=jobs)
+            batch_params = params
+
+        with pool:
+            # Bounded window of pending batches of signatures, the
+            # recipients are consumed as the results are given back.
+            pending = deque()
+            batch = []
+
+            for recipient in recipients:
+                batch.append(recipient)
+                if len(batch) >= self.WORKER_BATCH_SIZE:
+                    pending.append((batch, pool.submit(_sign_in_worker, batch_params, batch)))
+                    batch = []
+
+                if len(pending) >= jobs * 4:
+                    yield from self._from_worker(badge_obj, *pending.popleft())
+
+            if batch:
+                pending.append((batch, pool.submit(_sign_in_worker, batch_params, batch)))
+
+            while pending:
+                yield from self._from_worker(badge_obj, *pending.popleft())
+
+    def _from_worker(self, badge_obj, recipients, future):
+        for recipient, result in zip(recipients, future.result()):
+            serial_num, salt, assertion, signed = result
+
+            out = BadgeSigned(source=badge_obj, serial_num=serial_num,
+                              identity=recipient.identity,
+                              evidence=recipient.evidence,
+                              expiration=recipient.expiration, salt=salt,
+                              assertion=Assertion.decode(assertion))
+            out.signed = signed
+            yield out
+
+    def _new_badge(self, badge_obj, identity, evidence, expiration):
         serial_num = self.generate_uid()
         salt = b's4lt3d' if self.deterministic else md5_string(os.urandom(128))
 
-        out = BadgeSigned(source=badge_obj, serial_num=serial_num,
-                          identity=self.identity, evidence=self.evidence,
-                          expiration=self.expiration, salt=salt)
+        return BadgeSigned(source=badge_obj, serial_num=serial_num,
+                           identity=identity, evidence=evidence,
+                           expiration=expiration, salt=salt)
+
+    def _sign(self, badge_obj, template, identity, evidence, expiration):
+        out = self._new_badge(badge_obj, identity, evidence, expiration)
 
         self.generate_assertion(out)
 
-        if badge_obj.image_type is BadgeImgType.SVG:
-            self.append_svg_assertion(out)
-        elif badge_obj.image_type is BadgeImgType.PNG:
-            self.append_png_assertion(out)
+        out.signed = template.render(out.assertion.get_assertion())
 
         return out
 
@@ -115,86 +251,91 @@ class Signer():
     def generate_assertion(self, badge):
         """ Generate and Sign and OpenBadge assertion """
 
-        header, body = self.generate_jws(badge)
-        signature = jws_sign(header, body, badge.source.priv_key)
+        self.generate_assertions([badge])
 
-        badge.assertion = Assertion()
-        badge.assertion.encode_header(header)
-        badge.assertion.encode_body(body)
-        badge.assertion.encode_signature(signature)
+    def generate_assertions(self, badges):
+        """ Generate and sign the assertions of a batch of BadgeSigned of
+            the same Badge.
 
-    def has_assertion(self, badge):
-        """ Detect if a Badge is already signed """
+            The JOSE header is encoded and the signing algorithm looked up
+            once per batch, and the private key is used directly. """
 
-        if badge.image_type is BadgeImgType.SVG:
-            return self.has_svg_assertion(badge)
-        elif badge.image_type is BadgeImgType.PNG:
-            return self.has_png_assertion(badge)
+        if not badges:
+            return
 
+        source = badges[0].source
+        if not source.priv_key:
+            raise MissingKey('The badge %s has no private key to sign' % source.ini_name)
 
-    def append_svg_assertion(self, badge):
-        """ Append the assertion to a SVG File """
+        header = None
+        for badge in badges:
+            if header is None:
+                header, body = self.generate_jws(badge)
+                encoded_header = jws_utils.encode(header)
+                sign = algos.cached_route(header['alg'])['sign']
+            else:
+                body = self.generate_jws(badge)[1]
 
-        svg_doc = parseString(badge.source.image)
+            assertion = Assertion()
+            assertion.header = encoded_header
+            assertion.encode_body(body)
+            signature = sign(assertion.header + b'.' + assertion.body,
+                             source.priv_key)
+            assertion.encode_signature(signature)
 
-        # Assertion
-        svg_tag = svg_doc.getElementsByTagName('svg').item(0)
-        assertion_tag = svg_doc.createElement("openbadges:assertion")
-        assertion_tag.attributes['xmlns:openbadges'] = 'http://openbadges.org'
-        assertion_tag.attributes['verify']= badge.get_assertion()
-        svg_tag.appendChild(assertion_tag)
-        svg_tag.appendChild(svg_doc.createComment(' Signed with OpenBadgesLib %s ' % __version__))
+            badge.assertion = assertion
 
-        badge.signed = svg_doc.toxml().encode('utf-8')
-        svg_doc.unlink()
+    def has_assertion(self, badge, template=None):
+        """ Detect if a Badge is already signed """
 
-    def append_png_assertion(self, badge):
-        """ Append the assertion to a PNG file """
+        if template:
+            return template.has_assertion()
 
-        badge.signed = _signature
+        if badge.image_type is BadgeImgType.SVG:
+            return self.has_svg_assertion(badge)
+        elif badge.image_type is BadgeImgType.PNG:
+            return self.has_png_assertion(badge)
 
-        chunks = list()
-        png = Reader(bytes=badge.source.image)
 
-        for chunk in png.chunks():
-            chunks.append(chunk)
+    def append_svg_assertion(self, badge):
+        """ Append the assertion to a SVG File using a DOM """
 
-        itxt_data = b'openbadges' + pack('BBBBB',0,0,0,0,0) + badge.get_assertion().encode('utf-8')
-        itxt = ('iTXt', itxt_data)
-        chunks.insert(len(chunks)-1,itxt)
+        badge.signed = render_svg_dom(badge.source.image,
+                                      badge.assertion.get_assertion())
 
-        text_data = 'Comment Signed with OpenBadgesLib %s' % __version__
-        text = ('tEXt', text_data.encode('utf-8'))
-        chunks.insert(len(chunks)-1,text)
+    def append_png_assertion(self, badge):
+        """ Append the assertion to a PNG File. The new chunks are spliced
+            before IEND, the original chunks are copied untouched. """
 
-        for tag, data in chunks:
-            badge.signed = badge.signed + pack("!I", len(data))
-            tag = tag.encode('iso8859-1')
-            badge.signed = badge.signed + tag
-            badge.signed = badge.signed + data
-            checksum = crc32(tag)
-            checksum = crc32(data, checksum)
-            checksum &= 2**32-1
-            badge.signed = badge.signed + pack("!I", checksum)
+        template = PngBadgeTemplate(badge.source.image)
+        badge.signed = template.render(badge.assertion.get_assertion())
 
     def has_svg_assertion(self, badge):
-        xml_doc = parseString(badge.image)
-        has_assertion = False
+        return SvgBadgeTemplate(badge.image).has_assertion()
 
-        if xml_doc.getElementsByTagName('openbadges:assertion'):
-            has_assertion = True
+    def has_png_assertion(self, badge):
+        return PngBadgeTemplate(badge.image).has_assertion()
 
-        xml_doc.unlink()
-        return has_assertion
+""" Process pool workers of Signer.sign_many() """
 
-    def has_png_assertion(self, badge):
-        png = Reader(bytes=badge.image)
+_worker = None          # (run, Signer, Badge, template) of each worker process
 
-        for tag, data in png.chunks():
-            if tag == 'iTXt':
-                if data.startswith(b'openbadges'):
-                    return True
+def _load_worker(params):
+    """ Load the Badge, its private key and image template once per process
+        and run """
+    global _worker
+    run, signer_params, badge_params = params
 
-        return False
+    if _worker is None or _worker[0] != run:
+        sf = Signer(**signer_params)
+        badge_obj = Badge(**badge_params)
+        _worker = (run, sf, badge_obj, sf.create_template(badge_obj))
 
+    return _worker[1:]
 
+def _sign_in_worker(params, recipients):
+    """ Sign a batch of recipients. params is None if the pool initializer
+        loaded them """
+    sf, badge_obj, template = _load_worker(params) if params else _worker[1:]
+    return [(badge.serial_num, badge.salt, badge.assertion.get_assertion(), badge.signed)
+            for badge in sf._sign_batch(badge_obj, template, recipients)]
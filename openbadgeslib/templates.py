@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+        OpenBadges Library
+
+        Copyright (c) 2014-2015, Luis González Fernández, luisgf@luisgf.es
+        Copyright (c) 2014-2015, Jesús Cea Avión, jcea@jcea.es
+
+        All rights reserved.
+
+        This library is free software; you can redistribute it and/or
+        modify it under the terms of the GNU Lesser General Public
+        License as published by the Free Software Foundation; either
+        version 3.0 of the License, or (at your option) any later version.
+
+        This library is distributed in the hope that it will be useful,
+        but WITHOUT ANY WARRANTY; without even the implied warranty of
+        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+        Lesser General Public License for more details.
+
+        You should have received a copy of the GNU Lesser General Public
+        License along with this library.
+"""
+
+import re
+
+from struct import pack
+from xml.dom.minidom import parseString
+from xml.sax.saxutils import quoteattr
+
+from .errors import ErrorSigningFile
+from .pngutils import iter_chunks, make_chunk
+from .util import __version__
+
+OPENBADGES_NS = 'http://openbadges.org'
+
+class PngBadgeTemplate():
+    """ A PNG badge image parsed once and ready to embed assertions.
+
+        The position of the IEND chunk is recorded when the template is
+        created, so every signed badge is built splicing the new chunks
+        before IEND without parsing the image again. """
+
+    ITXT_HEADER = b'openbadges' + pack('BBBBB',0,0,0,0,0)
+
+    def __init__(self, image):
+        self.image = image                  # Binary contents of image file
+        self.signed = False                 # Image with an assertion
+        iend = None
+
+        for tag, offset, length in iter_chunks(image):
+            if tag == b'iTXt':
+                if image[offset+8:offset+18] == b'openbadges':
+                    self.signed = True
+            elif tag == b'IEND':
+                iend = offset
+
+        self.prefix = memoryview(image)[:iend]
+        self.suffix = memoryview(image)[iend:]
+
+        text_data = 'Comment Signed with OpenBadgesLib %s' % __version__
+        self.comment = make_chunk(b'tEXt', text_data.encode('utf-8'))
+
+    def has_assertion(self):
+        return self.signed
+
+    def render(self, assertion):
+        """ Return the image with the assertion (bytes) embedded """
+
+        return b''.join((self.prefix,
+                         make_chunk(b'iTXt', self.ITXT_HEADER + assertion),
+                         self.comment,
+                         self.suffix))
+
+class SvgBadgeTemplate():
+    """ A SVG badge image ready to embed assertions without a DOM.
+
+        The closing tag of the root element is located when the template is
+        created, and every signed badge is built inserting the assertion
+        element as bytes at that offset. If the closing tag can't be
+        located, the DOM is used as before.
+
+        With validate=True every rendered image is compared with the one
+        produced by the DOM, raising ErrorSigningFile if they differ. """
+
+    CLOSING_TAG = re.compile(rb'</svg\s*>\s*(?:<!--.*?-->\s*)*\Z', re.DOTALL)
+
+    def __init__(self, image, validate=False):
+        self.image = image                  # Binary contents of image file
+        self.validate = validate
+        self.prefix = self.suffix = None
+
+        # Only parse the document if the assertion tag could be there
+        self.signed = False
+        if b'openbadges:assertion' in image:
+            self.signed = has_svg_dom_assertion(image)
+
+        match = self.CLOSING_TAG.search(image)
+        if match:
+            self.prefix = memoryview(image)[:match.start()]
+            self.suffix = memoryview(image)[match.start():]
+
+        self.comment = ('<!-- Signed with OpenBadgesLib %s -->' % __version__).encode('utf-8')
+
+    def has_assertion(self):
+        return self.signed
+
+    def render(self, assertion):
+        """ Return the image with the assertion (bytes) embedded """
+
+        if self.prefix is None:
+            return render_svg_dom(self.image, assertion)
+
+        tag = ('<openbadges:assertion xmlns:openbadges=%s verify=%s/>'
+               % (quoteattr(OPENBADGES_NS), quoteattr(assertion.decode('utf-8'))))
+
+        signed = b''.join((self.prefix, tag.encode('utf-8'), self.comment,
+                           self.suffix))
+
+        if self.validate:
+            self.check(signed, assertion)
+
+        return signed
+
+    def check(self, signed, assertion):
+        """ Check that a rendered image is equivalent to the DOM one """
+
+        svg_doc = parseString(signed)
+        try:
+            same = svg_doc.toxml().encode('utf-8') == render_svg_dom(self.image, assertion)
+        finally:
+            svg_doc.unlink()
+
+        if not same:
+            raise ErrorSigningFile('The SVG signed without DOM differs from the DOM one')
+
+def render_svg_dom(image, assertion):
+    """ Append the assertion (bytes) to a SVG image using a DOM """
+
+    svg_doc = parseString(image)
+
+    try:
+        svg_tag = svg_doc.getElementsByTagName('svg').item(0)
+        assertion_tag = svg_doc.createElement("openbadges:assertion")
+        assertion_tag.attributes['xmlns:openbadges'] = OPENBADGES_NS
+        assertion_tag.attributes['verify'] = assertion.decode('utf-8')
+        svg_tag.appendChild(assertion_tag)
+        svg_tag.appendChild(svg_doc.createComment(' Signed with OpenBadgesLib %s ' % __version__))
+
+        return svg_doc.toxml().encode('utf-8')
+    finally:
+        svg_doc.unlink()
+
+def has_svg_dom_assertion(image):
+    """ Detect an assertion in a SVG image using a DOM """
+
+    svg_doc = parseString(image)
+
+    try:
+        return bool(svg_doc.getElementsByTagName('openbadges:assertion'))
+    finally:
+        svg_doc.unlink()
+
+if __name__ == '__main__':
+    pass
@@ -25,9 +25,14 @@
 __version__ = '0.4.2'     # Package Version
 
 import hashlib
-from urllib import request
-from urllib.request import HTTPSHandler
-from urllib.parse import urlparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse, urljoin
 from ssl import SSLContext, CERT_NONE, VERIFY_CRL_CHECK_CHAIN, PROTOCOL_TLSv1
 from ssl import SSLError
 
@@ -48,28 +53,262 @@ def md5_string(string):
 def hash_email(email, salt):
     return sha256_string(email + salt)
 
+class HttpResponse():
+    """ The result of a HTTP request """
+
+    def __init__(self, url=None, status=None, headers=None, body=None):
+        self.url = url
+        self.status = status
+        self.headers = headers if headers is not None else {}
+        self.body = body                  # None for 304 responses
+
+    def get_header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return default
+
+class Fetcher():
+    """ HTTP client keeping a pool of keep-alive connections per host.
+
+        All the HTTPS connections share one SSL context, and the idle
+        connections are reused by the next requests to the same host, so a
+        request on a warm connection costs a single round trip. It can be
+        used from several threads.
+
+        With a cache (cache.HttpCache) the GET requests are answered from it
+        when possible. """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, timeout=30, max_idle=4, cache=None):
+        self.timeout = timeout
+        self.max_idle = max_idle            # Idle connections kept per host
+        self.cache = cache
+
+        # SSL Context
+        self.sslctx = SSLContext(PROTOCOL_TLSv1)
+        self.sslctx.check_hostname = False
+        self.sslctx.verify_mode = CERT_NONE
+
+        self._pools = dict()                # (scheme, host, port) -> [connections]
+        self._lock = threading.Lock()
+
+    def fetch(self, url, headers=None):
+        """ Do a GET request for the url, returning a HttpResponse. Headers
+            allow conditional requests, 304 responses are returned too. """
+
+        if self.cache is not None:
+            return self.cache.fetch(url, headers)
+
+        return self.request(url, 'GET', headers)
+
+    def request(self, url, method='GET', headers=None):
+        """ Do a request following the redirections. Errors are raised as
+            urllib.error.HTTPError and URLError, like urllib does. """
+
+        for redirection in range(self.MAX_REDIRECTS + 1):
+            status, reason, response_headers, body = self._request(url, method, headers)
+
+            location = response_headers.get('Location')
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+
+            if status >= 400:
+                raise HTTPError(url, status, reason, response_headers, None)
+
+            return HttpResponse(url, status, dict(response_headers.items()),
+                                None if status == 304 else body)
+
+        raise URLError('Too many redirections at %s' % url)
+
+    def _request(self, url, method, headers):
+        u = urlparse(url)
+
+        if u.scheme != 'https':
+            print('Warning! %s doesn\'t use TLS.' % url)
+
+        if not u.hostname or u.scheme not in ('http', 'https'):
+            raise ValueError('The URL %s was malformed' % url)
+
+        key = (u.scheme, u.hostname, u.port)
+        path = u.path or '/'
+        if u.query:
+            path += '?' + u.query
+
+        request_headers = {'User-Agent': 'OpenBadgesLib/%s' % __version__}
+        request_headers.update(headers or {})
+
+        while True:
+            conn, reused = self._get_connection(key)
+            try:
+                conn.request(method, path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (HTTPException, OSError) as err:
+                conn.close()
+                # The server may have closed an idle connection, retry once
+                if reused:
+                    continue
+                raise URLError(err)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._put_connection(key, conn)
+
+            return response.status, response.reason, response.msg, body
+
+    def _get_connection(self, key):
+        with self._lock:
+            idle = self._pools.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return HTTPSConnection(host, port, timeout=self.timeout,
+                                   context=self.sslctx), False
+
+        return HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _put_connection(self, key, conn):
+        with self._lock:
+            idle = self._pools.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        """ Close all the idle connections """
+
+        with self._lock:
+            pools, self._pools = self._pools, dict()
+
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+default_fetcher = Fetcher()
+
+def fetch_url(url, headers=None):
+    """ Do a GET request for the url with the default Fetcher, returning a
+        HttpResponse. Headers allow conditional requests, 304 responses are
+        returned too. """
+
+    return default_fetcher.fetch(url, headers)
+
+class UrlChecker():
+    """ Check that urls are reachable without downloading them.
+
+        The urls are checked concurrently with HEAD requests, or a GET of
+        the first byte if the server doesn't support HEAD. The reachable
+        urls are remembered for ttl seconds, so repeated checks (every badge
+        of a run, several runs in a process) don't go to the network. """
+
+    def __init__(self, ttl=300, jobs=4, fetcher=None):
+        self.ttl = ttl
+        self.jobs = jobs
+        self.fetcher = fetcher or default_fetcher
+        self._reachable = dict()            # Url -> Expiration timestamp
+        self._lock = threading.Lock()
+
+    def check(self, urls):
+        """ Return a dict of url -> error message, None if reachable """
+
+        now = time.time()
+        results = dict()
+        pending = []
+
+        with self._lock:
+            for url in urls:
+                if self._reachable.get(url, 0) > now:
+                    results[url] = None
+                elif url not in pending:
+                    pending.append(url)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.jobs, len(pending))) as executor:
+                results.update(zip(pending, executor.map(self._check, pending)))
+
+        with self._lock:
+            for url in pending:
+                if results[url] is None:
+                    self._reachable[url] = now + self.ttl
+
+        return results
+
+    def _check(self, url):
+        try:
+            try:
+                self.fetcher.request(url, 'HEAD')
+            except HTTPError as err:
+                if err.code not in (405, 501):
+                    raise
+                self.fetcher.request(url, 'GET', {'Range': 'bytes=0-0'})
+        except Exception as err:
+            return str(err)
+
+        return None
+
+    def clear(self):
+        """ Forget the reachable urls """
+
+        with self._lock:
+            self._reachable.clear()
+
+default_url_checker = UrlChecker()
+
 def download_file(url):
     """ This function download a file from server """
 
-    u = urlparse(url)
+    return fetch_url(url).body
+
+def write_file_atomic(file_name, data, replace=True, mode=None):
+    """ Write a file so other processes never see it half written. With
+        replace=False FileExistsError is raised if the file exists, even if
+        other process creates it meanwhile. The file is only readable by
+        its owner unless a mode is given. """
+
+    directory = os.path.dirname(file_name) or os.path.curdir
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix='.tmp')
 
-    if u.scheme != 'https':
-        print('Warning! %s doesn\'t use TLS.' % url)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp_name, mode)
+        if replace:
+            os.replace(tmp_name, file_name)
+        else:
+            os.link(tmp_name, file_name)
+            os.remove(tmp_name)
+    except:
+        os.remove(tmp_name)
+        raise
 
-    if u.hostname == b'':
-        raise AssertionFormatIncorrect('The URL %s was malformed' % url)
+def cache_lifetime(response, default):
+    """ Seconds a response can be cached according to its Cache-Control
+        header, or default if the server doesn't say it """
 
-    # SSL Context
-    sslctx = SSLContext(PROTOCOL_TLSv1)
-    sslctx.verify_mode = CERT_NONE
-    sslctx_handler = HTTPSHandler(context=sslctx, check_hostname=False)
+    cache_control = response.get_header('Cache-Control', '').lower()
+    directives = [d.strip() for d in cache_control.split(',')]
 
-    request.install_opener(request.build_opener(sslctx_handler))
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
 
-    with request.urlopen(url, timeout=30) as kd:
-        file = kd.read()
+    for directive in directives:
+        if directive.startswith('max-age='):
+            try:
+                return max(0, int(directive[8:]))
+            except ValueError:
+                pass
 
-    return file
+    return default
 
 def show_ecc_disclaimer():
     print("""    DISCLAIMER!
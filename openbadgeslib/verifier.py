@@ -26,6 +26,7 @@ logger = logging.getLogger(__name__)
 
 import os
 import sys
+import copy
 
 from enum import Enum
 from Crypto.PublicKey import RSA
@@ -38,14 +39,38 @@ import json
 
 # Local imports
 from .errors import UnknownKeyType, AssertionFormatIncorrect, \
-            NotIdentityInAssertion, ErrorParsingFile, PublicKeyReadError
+            NotIdentityInAssertion, ErrorParsingFile, PublicKeyReadError, \
+            VerifyKeyUnavailable, VerifierExceptions
 
 from .jws import utils as jws_utils
-from .jws import verify_block as jws_verify_block
+from .jws import verify_parsed as jws_verify_parsed
+from .jws import exceptions as jws_exceptions
 from .jws.exceptions import SignatureError as JWS_SignatureError
-from .keys import KeyType, detect_key_type
+from .keys import KeyType
+from .keyring import default_keyring
 from .util import hash_email, sha256_string, download_file, show_ecc_disclaimer
 from .badge import BadgeStatus
+from .cache import KeyCache, RevocationCache
+from .resolver import DownloadKeyResolver
+
+# Errors of a single badge, reported as a signature error by verify_many so
+# the rest of the batch is verified
+BADGE_ERRORS = (VerifierExceptions, ValueError, KeyError,
+                jws_exceptions.MissingKey, jws_exceptions.MissingSigner,
+                jws_exceptions.MissingVerifier, jws_exceptions.SignatureError,
+                jws_exceptions.RouteMissingError, jws_exceptions.RouteEndpointError,
+                jws_exceptions.AlgorithmNotImplemented,
+                jws_exceptions.ParameterNotImplemented,
+                jws_exceptions.ParameterNotUnderstood)
+
+def check_assertion_signature(assertion, key):
+    """ Verify the JWS signature of a parsed Assertion, raising
+        jws.SignatureError if it isn't valid. The header is decoded once
+        and the signing input is not copied. """
+
+    return jws_verify_parsed(assertion.decode_header(),
+                             assertion.get_signing_input(),
+                             assertion.decode_signature(), key)
 
 class VerifyInfo():
     def __init__(self, status=BadgeStatus.NONE, msg=None):
@@ -53,41 +78,49 @@ class VerifyInfo():
         self.msg = msg
 
 class Verifier():
-    def __init__(self, verify_key=None, identity=None):
+    def __init__(self, verify_key=None, identity=None, revocation_cache=None,
+                 key_resolver=None, precompute=False):
         self.verify_key = verify_key
         self.identity = identity.encode('utf-8')
 
+        # Without a shared cache the revocation list is always downloaded
+        self.revocation_cache = revocation_cache or RevocationCache(interval=0)
+
+        # Resolver used instead of downloading the key of each badge
+        self.key_resolver = key_resolver
+
+        # Verify with precomputed ECC keys, for many badges of few issuers
+        self.precompute = precompute
+
+        self.key_type = None
+        self.pub_key = None
+        self.ecc_disclaimer = True          # Show it once
+
+        # A local key overrides the one of the badges
         if self.verify_key:
-            self.key_type = detect_key_type(self.verify_key)
+            record = default_keyring.load_public_key(self.verify_key)
+            self.key_type, self.pub_key = record.key_type, record.key
 
     def get_identity(self):
         return self.identity.decode('utf-8')
 
-    def get_badge_status(self, badge):
+    def get_badge_status(self, badge, identity=None):
+        """ Verify a badge for the identity of the Verifier, or the given
+            one """
 
-        if badge.source.key_type is KeyType.ECC:
-            show_ecc_disclaimer()
+        try:
+            self.get_verify_key(badge)
+        except VerifyKeyUnavailable as err:
+            return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, str(err))
+
+        self.check_ecc_disclaimer(self.key_type or badge.source.key_type)
 
         try:
-            if self.check_jws_signature(badge) is not BadgeStatus.VALID:
+            if self.check_jws_signature(badge).status is BadgeStatus.VALID:
                 """ Signature is cryptographically correct """
 
-                 # Are this badge revoked?
                 reason = self.check_revocation(badge)
-                if reason:
-                    error = 'The badge %s has been revoked. Reason: %s' % (badge.serial_num, reason)
-                    return VerifyInfo(BadgeStatus.REVOKED, error)
-
-                # Are this badge expired?
-                if badge.expiration:
-                    expiration = self.check_expiration(badge)
-                    if expiration:
-                        error = 'The badge with UID %s has expired at: %s' % (badge.serial_num, expiration)
-                        return VerifyInfo(BadgeStatus.EXPIRED, error)
-
-                if not self.check_identity(badge):
-                    error = 'Identity mismatch for: %s' % self.get_identity()
-                    return VerifyInfo(BadgeStatus.IDENTITY_ERROR, error)
+                return self.get_assertion_status(badge, identity, reason)
             else:
                 return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, 'Signature invalid, corrupted or tampered')
 
@@ -96,42 +129,114 @@ class Verifier():
         except URLError as e:
             return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, e.reason)
 
+    def get_assertion_status(self, badge, identity, reason):
+        """ Check the assertion of a badge with a valid signature, given
+            its revocation reason (None if not revoked). identity can be
+            None to use the one of the Verifier """
+
+        if isinstance(identity, str):
+            identity = identity.encode('utf-8')
+        identity = identity or self.identity
+
+        # Are this badge revoked?
+        if reason:
+            error = 'The badge %s has been revoked. Reason: %s' % (badge.serial_num, reason)
+            return VerifyInfo(BadgeStatus.REVOKED, error)
+
+        # Are this badge expired?
+        if badge.expiration:
+            expiration = self.check_expiration(badge)
+            if expiration:
+                error = 'The badge with UID %s has expired at: %s' % (badge.serial_num, expiration)
+                return VerifyInfo(BadgeStatus.EXPIRED, error)
+
+        if not self.check_identity(badge, identity):
+            error = 'Identity mismatch for: %s' % identity.decode('utf-8')
+            return VerifyInfo(BadgeStatus.IDENTITY_ERROR, error)
+
         # OK, all is correct.
         return VerifyInfo(BadgeStatus.VALID, 'OK')
 
+    def check_ecc_disclaimer(self, key_type):
+        """ Show the ECC disclaimer the first time an ECC key is used """
+
+        if key_type is KeyType.ECC and self.ecc_disclaimer:
+            show_ecc_disclaimer()
+            self.ecc_disclaimer = False
+
+    def verify_many(self, badges):
+        """ Verify a batch of badges, returning an iterator of VerifyInfo in
+            the same order. The items are BadgeSigned objects, verified for
+            the identity of the Verifier, or (BadgeSigned, identity) pairs.
+
+            Each distinct badge json, issuer json, revocation list and
+            verify key url is resolved only once in the batch, unless the
+            Verifier has its own caches. A badge that can't be verified is
+            reported as a SIGNATURE_ERROR and the batch goes on. """
+
+        batch = copy.copy(self)
+        fetch = self.revocation_cache.fetch
+
+        if not self.revocation_cache.interval:
+            batch.revocation_cache = RevocationCache(interval=float('inf'),
+                                                     fetch=fetch)
+
+        if not self.key_resolver:
+            batch.key_resolver = KeyCache(ttl=float('inf'), fetch=fetch)
+
+        for item in badges:
+            badge, identity = item if isinstance(item, tuple) else (item, None)
+
+            try:
+                info = batch.get_badge_status(badge, identity)
+            except BADGE_ERRORS as err:
+                info = VerifyInfo(BadgeStatus.SIGNATURE_ERROR, str(err) or repr(err))
+
+            yield info
+
+        self.ecc_disclaimer = batch.ecc_disclaimer
+
+    def get_verify_key(self, badge):
+        """ Return the key used to verify a badge. The local key of the
+            Verifier is used if there is one, and the key resolver of the
+            Verifier replaces the download of the key from the issuer. """
+
+        if self.pub_key:
+            return self.pub_key
+
+        if self.key_resolver and isinstance(badge.key_resolver, DownloadKeyResolver):
+            return badge.resolve_key(self.key_resolver)
+
+        return badge.resolve_key()
+
+    def get_signature_key(self, badge):
+        """ Return the key used to check the signature of a badge, with
+            precomputed tables if the Verifier was asked to """
+
+        key = self.get_verify_key(badge)
+
+        if self.precompute:
+            key = default_keyring.get_precomputed(self.verify_key or badge.source.pubkey_pem)
+
+        return key
+
     def check_jws_signature(self, badge):
+        """ Check the signature of the assertion, decoded only once """
+
         try:
-            if jws_verify_block(badge.assertion.get_assertion(), badge.source.pub_key):
+            if check_assertion_signature(badge.assertion, self.get_signature_key(badge)):
                 return VerifyInfo(BadgeStatus.VALID, 'OK')
 
         except JWS_SignatureError as err:
             return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, err)
 
-    def check_revocation(self, badge):
-        """ Return true if the badge has been revoked """
-
-        serial_num = badge.serial_num
+        return VerifyInfo(BadgeStatus.SIGNATURE_ERROR, 'Signature invalid, corrupted or tampered')
 
-        badge_json = download_file(badge.source.json_url)
-        if not badge_json:
-            raise AssertionFormatIncorrect('Badge JSON doesn\'t exists %s' % badge.source.json_url)
-        try:    
-            badge = jws_utils.from_json(badge_json)
-        except:
-            raise AssertionFormatIncorrect("Badge JSON format incorrect at %s" % badge.source.json_url)
-
-        issuer_json = download_file(badge['issuer'])
-        issuer = jws_utils.from_json(issuer_json)
-
-        revocation_json = download_file(issuer['revocationList'])
-        revocation = jws_utils.from_json(revocation_json)
-
-        if revocation:
-            for badge_id in revocation:
-                if badge_id == serial_num:
-                    return revocation[badge_id]
+    def check_revocation(self, badge):
+        """ Return the revocation reason if the badge has been revoked """
 
-        return None
+        return self.revocation_cache.check(badge.source.json_url,
+                                           badge.serial_num)
 
     def check_expiration(self, badge):
         from time import gmtime, strftime
@@ -142,10 +247,10 @@ class Verifier():
         else:
             return None
 
-    def check_identity(self, badge):
+    def check_identity(self, badge, identity=None):
         try:
             email_salt = badge.salt if badge.salt else b''
-            email_hashed = b'sha256$' + hash_email(self.identity, email_salt)
+            email_hashed = b'sha256$' + hash_email(identity or self.identity, email_salt)
 
             if email_hashed == badge.identity:
                 return True
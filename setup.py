@@ -6,8 +6,7 @@ version = '0.4.2'
 
 dependencies = [
         'ecdsa',
-        'pycrypto',
-        'pypng'
+        'pycrypto'
         ]
 
 setup(
@@ -27,7 +26,6 @@ setup(
       'Development Status :: 3 - Alpha',
       'Intended Audience :: Developers',
       'Operating System :: OS Independent',
-      'Programming Language :: Python :: 3.4',
       'Programming Language :: Python :: 3.5',
       'Topic :: Software Development :: Libraries :: Python Modules',
       'Natural Language :: English',
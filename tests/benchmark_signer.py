@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+    Compare the time to sign assertions one by one through jws.sign, the
+    path used before Signer.generate_assertions(), with the batch path.
+
+    Run from the tests directory: python3 benchmark_signer.py [N]
+"""
+
+import sys
+import time
+
+import test_common
+
+from openbadgeslib import signer
+from openbadgeslib.badge import Badge, BadgeType, Assertion
+from openbadgeslib.confparser import ConfParser
+from openbadgeslib.jws import sign as jws_sign
+
+def sign_one_by_one(sf, badges):
+    for badge in badges:
+        header, body = sf.generate_jws(badge)
+        signature = jws_sign(header, body, badge.source.priv_key)
+
+        badge.assertion = Assertion()
+        badge.assertion.encode_header(header)
+        badge.assertion.encode_body(body)
+        badge.assertion.encode_signature(signature)
+
+def sign_batch(sf, badges):
+    sf.generate_assertions(badges)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    conf = ConfParser('./config1.ini').read_conf()
+    sf = signer.Signer(identity=b'one@example.com', badge_type=BadgeType.SIGNED)
+
+    for badge_name in ('badge_test_1', 'badge_test_2'):
+        badge_obj = Badge.create_from_conf(conf, badge_name)
+
+        for name, function in (('one by one', sign_one_by_one),
+                               ('batch', sign_batch)):
+            badges = [sf._new_badge(badge_obj, b'one@example.com', None, None)
+                      for i in range(count)]
+
+            start = time.perf_counter()
+            function(sf, badges)
+            elapsed = time.perf_counter() - start
+
+            print('%s %-10s %d assertions in %.3f seconds (%.1f/s)'
+                  % (badge_obj.key_type.name, name, count, elapsed, count / elapsed))
+
+if __name__ == '__main__':
+    main()
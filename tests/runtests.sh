@@ -1,4 +1,4 @@
 #!/bin/sh
 
-python3.4 -m unittest discover -p "test_*.py" $*
+python3.5 -m unittest discover -p "test_*.py" $*
 
@@ -0,0 +1,238 @@
+import unittest
+from unittest.mock import Mock, patch, mock_open, call
+
+import os, shutil, tempfile
+import json
+import threading, time
+
+import test_common
+
+from openbadgeslib.badge import Badge, BadgeSigned
+from openbadgeslib.cache import KeyCache, RevocationCache, HttpCache
+from openbadgeslib.verifier import Verifier
+from openbadgeslib.keys import KeyType
+from openbadgeslib.util import HttpResponse
+
+KEY_URL = 'https://issuer.badge/badge_1/verify_rsa_key.pem'
+
+class FakeServer():
+    """ Answer the requests with a fixed body, honoring If-None-Match """
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or {}
+        self.requests = []
+
+    def fetch(self, url, headers=None):
+        self.requests.append((url, headers))
+        if headers and headers.get('If-None-Match') == self.headers.get('ETag'):
+            return HttpResponse(url, 304, self.headers)
+        return HttpResponse(url, 200, self.headers, self.body)
+
+class check_key_cache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open('test_verify_rsa.pem', 'rb') as f:
+            cls.rsa_pem = f.read()
+        with open('test_verify_ecc.pem', 'rb') as f:
+            cls.ecc_pem = f.read()
+
+    def test_fetch_once(self):
+        """ A key is downloaded and parsed once """
+
+        server = FakeServer(self.rsa_pem)
+        cache = KeyCache(fetch=server.fetch)
+
+        first = cache.resolve(KEY_URL)
+        second = cache.resolve(KEY_URL)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(first[0], self.rsa_pem)
+        self.assertIs(first[1], KeyType.RSA)
+        self.assertIs(first[2], second[2])
+
+    def test_revalidate(self):
+        """ Stale keys are revalidated with their ETag """
+
+        server = FakeServer(self.ecc_pem, {'ETag': '"v1"',
+                                           'Cache-Control': 'max-age=0'})
+        cache = KeyCache(fetch=server.fetch)
+
+        first = cache.resolve(KEY_URL)
+        second = cache.resolve(KEY_URL)
+
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(server.requests[1][1], {'If-None-Match': '"v1"'})
+        self.assertIs(first[1], KeyType.ECC)
+        self.assertIs(first[2], second[2])
+
+    def test_lru(self):
+        """ The least recently used keys are evicted """
+
+        server = FakeServer(self.rsa_pem)
+        cache = KeyCache(max_keys=2, fetch=server.fetch)
+
+        for url in ('https://a/key.pem', 'https://b/key.pem',
+                    'https://a/key.pem', 'https://c/key.pem',
+                    'https://a/key.pem', 'https://b/key.pem'):
+            cache.resolve(url)
+
+        self.assertEqual([url for url, headers in server.requests],
+                         ['https://a/key.pem', 'https://b/key.pem',
+                          'https://c/key.pem', 'https://b/key.pem'])
+
+    def test_disk(self):
+        """ Keys saved on disk are used by other caches """
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        server = FakeServer(self.rsa_pem)
+        KeyCache(cache_dir=cache_dir, fetch=server.fetch).resolve(KEY_URL)
+        pem, key_type, key = KeyCache(cache_dir=cache_dir, fetch=server.fetch).resolve(KEY_URL)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(pem, self.rsa_pem)
+        self.assertIs(key_type, KeyType.RSA)
+
+class FakeIssuer():
+    """ An issuer publishing a badge and its revocation list """
+
+    def __init__(self, revoked):
+        self.files = {
+            'https://issuer.badge/badge_1/badge.json': json.dumps(dict(
+                issuer='https://issuer.badge/organization.json')),
+            'https://issuer.badge/organization.json': json.dumps(dict(
+                revocationList='https://issuer.badge/revoked.json')),
+            'https://issuer.badge/revoked.json': json.dumps(revoked),
+        }
+        self.requests = []
+
+    def fetch(self, url, headers=None):
+        self.requests.append((url, headers))
+        if headers and headers.get('If-None-Match') == '"v1"':
+            return HttpResponse(url, 304, {'ETag': '"v1"'})
+        return HttpResponse(url, 200, {'ETag': '"v1"'},
+                            self.files[url].encode('utf-8'))
+
+class check_revocation_cache(unittest.TestCase):
+    JSON_URL = 'https://issuer.badge/badge_1/badge.json'
+
+    def test_check(self):
+        """ Revoked badges are found without new requests """
+
+        issuer = FakeIssuer({'1234': 'Cheating'})
+        cache = RevocationCache(fetch=issuer.fetch)
+
+        self.assertEqual(cache.check(self.JSON_URL, '1234'), 'Cheating')
+        self.assertIsNone(cache.check(self.JSON_URL, '5678'))
+        self.assertEqual(len(issuer.requests), 3)
+
+    def test_refresh(self):
+        """ The revocation lists are revalidated when stale """
+
+        issuer = FakeIssuer({'1234': 'Cheating'})
+        cache = RevocationCache(interval=0, fetch=issuer.fetch)
+
+        cache.check(self.JSON_URL, '1234')
+        self.assertEqual(cache.check(self.JSON_URL, '1234'), 'Cheating')
+        self.assertEqual(len(issuer.requests), 6)
+        self.assertEqual(issuer.requests[-1],
+                         ('https://issuer.badge/revoked.json', {'If-None-Match': '"v1"'}))
+
+    def test_verifier(self):
+        """ The Verifier checks the revocations with the cache """
+
+        issuer = FakeIssuer({'1234': 'Cheating'})
+        v = Verifier(identity='one@example.com',
+                     revocation_cache=RevocationCache(fetch=issuer.fetch))
+        badge = BadgeSigned(source=Badge(json_url=self.JSON_URL),
+                            serial_num='1234')
+
+        self.assertEqual(v.check_revocation(badge), 'Cheating')
+        badge.serial_num = '5678'
+        self.assertIsNone(v.check_revocation(badge))
+
+class FakeFetcher():
+    """ A Fetcher answering with FakeServer, slowly """
+
+    def __init__(self, server, delay=0):
+        self.server = server
+        self.delay = delay
+
+    def request(self, url, method='GET', headers=None):
+        time.sleep(self.delay)
+        return self.server.fetch(url, headers)
+
+class check_http_cache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_shared(self):
+        """ The responses saved by a cache are used by other ones """
+
+        server = FakeServer(b'{"revoked": {}}', {'ETag': '"v1"'})
+        HttpCache(self.cache_dir, fetcher=FakeFetcher(server)).fetch(KEY_URL)
+        response = HttpCache(self.cache_dir, fetcher=FakeFetcher(server)).fetch(KEY_URL)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'{"revoked": {}}')
+        self.assertEqual(response.get_header('ETag'), '"v1"')
+
+        # Conditional requests of the caller are answered too
+        response = HttpCache(self.cache_dir, fetcher=FakeFetcher(server)).fetch(
+                        KEY_URL, {'If-None-Match': '"v1"'})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_content_addressed(self):
+        """ The bodies are saved once, by digest, and checked """
+
+        server = FakeServer(b'same body')
+        cache = HttpCache(self.cache_dir, fetcher=FakeFetcher(server))
+        cache.fetch('https://a/file')
+        cache.fetch('https://b/file')
+
+        objects = os.listdir(os.path.join(self.cache_dir, 'objects'))
+        self.assertEqual(len(objects), 1)
+
+        # A corrupt body is downloaded again
+        with open(os.path.join(self.cache_dir, 'objects', objects[0]), 'wb') as f:
+            f.write(b'corrupt')
+        self.assertEqual(cache.fetch('https://a/file').body, b'same body')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_revalidate(self):
+        """ Stale responses are revalidated with their validators """
+
+        server = FakeServer(self.id().encode('utf-8'),
+                            {'ETag': '"v1"', 'Cache-Control': 'max-age=0'})
+        cache = HttpCache(self.cache_dir, fetcher=FakeFetcher(server))
+
+        cache.fetch(KEY_URL)
+        response = cache.fetch(KEY_URL)
+
+        self.assertEqual(server.requests[1], (KEY_URL, {'If-None-Match': '"v1"'}))
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, self.id().encode('utf-8'))
+
+    def test_stampede(self):
+        """ Concurrent misses of the same url do a single request """
+
+        server = FakeServer(b'body')
+        results = []
+
+        def fetch():
+            cache = HttpCache(self.cache_dir, fetcher=FakeFetcher(server, 0.1))
+            results.append(cache.fetch(KEY_URL).body)
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [b'body']*4)
+        self.assertEqual(len(server.requests), 1)
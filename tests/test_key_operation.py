@@ -2,11 +2,14 @@ import unittest
 from unittest.mock import Mock, patch, mock_open, call
 
 import functools, hashlib
+import os, shutil, tempfile
+from configparser import ConfigParser
 
 import test_common
 
-from openbadgeslib import keys
-from openbadgeslib.errors import UnknownKeyType
+from openbadgeslib import keys, keyring
+from openbadgeslib.errors import UnknownKeyType, PrivateKeySaveError
+from openbadgeslib.openbadges_keygenerator import find_missing_keys
 from openbadgeslib.confparser import ConfParser
 
 import ecdsa
@@ -128,3 +131,117 @@ class checkKeysECC(checkKeysBase, unittest.TestCase) :
 
         return verify
 
+
+class check_keyring(unittest.TestCase) :
+    @classmethod
+    def setUpClass(cls) :
+        cls.pems = dict()
+        for name in ('test_sign_rsa.pem', 'test_verify_rsa.pem',
+                     'test_sign_ecc.pem', 'test_verify_ecc.pem') :
+            with open(name, 'rb') as f :
+                cls.pems[name] = f.read()
+
+    def test_parse_once(self) :
+        ring = keyring.Keyring()
+
+        with patch('openbadgeslib.keyring.load_public_key',
+                   wraps=keys.load_public_key) as load :
+            record = ring.load_public_key(self.pems['test_verify_ecc.pem'])
+            self.assertIs(ring.load_public_key(self.pems['test_verify_ecc.pem']), record)
+            self.assertEqual(load.call_count, 1)
+
+        self.assertIs(record.key_type, keys.KeyType.ECC)
+        self.assertIsInstance(record.key, ecdsa.VerifyingKey)
+        self.assertFalse(record.private)
+
+    def test_fingerprint(self) :
+        ring = keyring.Keyring()
+
+        for private, public, key_type in (('test_sign_rsa.pem', 'test_verify_rsa.pem', keys.KeyType.RSA),
+                                          ('test_sign_ecc.pem', 'test_verify_ecc.pem', keys.KeyType.ECC)) :
+            private_record = ring.load_private_key(self.pems[private])
+            public_record = ring.load_public_key(self.pems[public], 'https://issuer/' + public)
+
+            self.assertIs(private_record.key_type, key_type)
+            self.assertTrue(private_record.private)
+            self.assertEqual(private_record.fingerprint, public_record.fingerprint)
+            self.assertIs(ring.get(public_record.fingerprint), public_record)
+            self.assertIs(ring.get_by_url('https://issuer/' + public), public_record)
+
+        self.assertRaises(UnknownKeyType, ring.load_public_key, b'garbage')
+
+    def test_lru(self) :
+        ring = keyring.Keyring(max_keys=1)
+
+        rsa = ring.load_public_key(self.pems['test_verify_rsa.pem'], 'https://issuer/rsa.pem')
+        ring.load_public_key(self.pems['test_verify_ecc.pem'])
+
+        self.assertIsNone(ring.get(rsa.fingerprint))
+        self.assertIsNone(ring.get_by_url('https://issuer/rsa.pem'))
+
+    def test_precomputed(self) :
+        ring = keyring.Keyring(max_precomputed=1)
+        ecc_pem = self.pems['test_verify_ecc.pem']
+
+        key = ring.get_precomputed(ecc_pem)
+        self.assertIs(ring.get_precomputed(ecc_pem), key)
+        self.assertIsNot(key, ring.load_public_key(ecc_pem).key)
+        self.assertEqual(key.to_string(), ring.load_public_key(ecc_pem).key.to_string())
+
+        signing_key = ecdsa.SigningKey.from_pem(self.pems['test_sign_ecc.pem'])
+        signature = signing_key.sign_deterministic(b'message', hashfunc=hashlib.sha256)
+        self.assertTrue(key.verify(signature, b'message', hashfunc=hashlib.sha256))
+
+        # RSA keys are returned as they are
+        rsa_pem = self.pems['test_verify_rsa.pem']
+        self.assertIs(ring.get_precomputed(rsa_pem), ring.load_public_key(rsa_pem).key)
+
+        # Only max_precomputed keys are kept
+        other = ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).get_verifying_key().to_pem()
+        ring.get_precomputed(other)
+        self.assertIsNot(ring.get_precomputed(ecc_pem), key)
+
+class check_key_files(unittest.TestCase) :
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_generate(self):
+        """ The key files are written once, and never replaced """
+
+        private_key = os.path.join(self.dir, 'sign.pem')
+        public_key = os.path.join(self.dir, 'verify.pem')
+
+        keys.generate_key_files(private_key, public_key, keys.KeyType.ECC)
+
+        with open(private_key, 'rb') as f:
+            signing_key = ecdsa.SigningKey.from_pem(f.read())
+        with open(public_key, 'rb') as f:
+            self.assertEqual(f.read(), signing_key.get_verifying_key().to_pem())
+        self.assertEqual(sorted(os.listdir(self.dir)), ['sign.pem', 'verify.pem'])
+        self.assertEqual(os.stat(private_key).st_mode & 0o777, 0o600)
+        self.assertEqual(os.stat(public_key).st_mode & 0o777, 0o644)
+
+        self.assertRaises(PrivateKeySaveError, keys.generate_key_files,
+                          private_key, public_key, keys.KeyType.ECC)
+
+    def test_find_missing(self):
+        """ Only the badges without any key file are generated, once for
+            the badges sharing them """
+
+        open(os.path.join(self.dir, 'sign_2.pem'), 'wb').close()
+        open(os.path.join(self.dir, 'sign_3.pem'), 'wb').close()
+        open(os.path.join(self.dir, 'verify_3.pem'), 'wb').close()
+
+        conf = ConfigParser()
+        conf['issuer'] = dict(name='Issuer')
+        for i in range(1, 4):
+            conf['badge_%d' % i] = dict(private_key=os.path.join(self.dir, 'sign_%d.pem' % i),
+                                        public_key=os.path.join(self.dir, 'verify_%d.pem' % i))
+
+        conf['badge_4'] = conf['badge_1']
+
+        missing, partial = find_missing_keys(conf)
+        self.assertEqual(missing, [('badge_1', conf['badge_1']['private_key'],
+                                    conf['badge_1']['public_key'])])
+        self.assertEqual(partial, ['badge_2'])
@@ -3,18 +3,24 @@ from unittest.mock import Mock, patch, mock_open, call
 
 import functools, hashlib
 import json
+import os, shutil, tempfile
 
 import test_common
 
 
 from openbadgeslib import signer
-from openbadgeslib.errors import UnknownKeyType
-from openbadgeslib.confparser import ConfParser
+from openbadgeslib.errors import UnknownKeyType, RecipientsFileError, \
+        BadgeImgFormatIncorrect, ErrorSigningFile
+from openbadgeslib.confparser import ConfParser, ConfSnapshot
 from openbadgeslib.util import md5_string
 from openbadgeslib.logs import Logger
 from openbadgeslib.keys import KeyType
 from openbadgeslib.badge import Badge, BadgeType, BadgeImgType, Assertion, BadgeSigned
 from openbadgeslib.confparser import ConfParser
+from openbadgeslib.recipients import Recipient, read_recipients_file
+from openbadgeslib.openbadges_signer import pending_recipients
+from openbadgeslib.pngutils import iter_chunks, find_chunk
+from openbadgeslib.templates import PngBadgeTemplate, SvgBadgeTemplate
 
 class check_badge(unittest.TestCase) :
     def test_check_testconf(self):
@@ -204,6 +210,52 @@ class check_badge(unittest.TestCase) :
         decode = Assertion.decode(payload)
         self.assertEqual(decode.get_assertion(), payload)
         
+class check_conf_snapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        for name in ('config1.ini', 'test_sign_rsa.pem', 'test_verify_rsa.pem',
+                     'test_sign_ecc.pem', 'test_verify_ecc.pem'):
+            shutil.copy(name, self.dir)
+        shutil.copytree('images', os.path.join(self.dir, 'images'))
+
+        self.config = os.path.join(self.dir, 'config1.ini')
+
+    def test_snapshot(self):
+        """ The snapshot has the resolved values of config.ini """
+
+        conf = ConfParser(self.config).read_conf()
+        snapshot = ConfParser(self.config, snapshot=True).read_conf()
+
+        self.assertIsInstance(snapshot, ConfSnapshot)
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, '.config1.ini.snapshot')))
+        self.assertEqual(snapshot.sections(), conf.sections())
+        for name in conf.sections():
+            self.assertEqual(snapshot[name], dict(conf[name]))
+        self.assertEqual(snapshot['badge_test_1'].name, 'badge_test_1')
+
+        badge = Badge.create_from_conf(snapshot, 'badge_test_2')
+        self.assertIs(badge.key_type, KeyType.ECC)
+        self.assertEqual(badge.image, Badge.create_from_conf(conf, 'badge_test_2').image)
+
+    def test_invalidation(self):
+        """ The snapshot is made again when config.ini changes """
+
+        cf = ConfParser(self.config, snapshot=True)
+        cf.read_conf()
+
+        # Not parsed again while unchanged, even if touched
+        with patch.object(cf, '_parse') as mock_parse:
+            cf.read_conf()
+            os.utime(self.config, ns=(0, 0))
+            cf.read_conf()
+            self.assertFalse(mock_parse.called)
+
+        with open(self.config, 'a') as f:
+            f.write('\n[badge_new]\nname = New\n')
+        self.assertEqual(cf.read_conf()['badge_new']['name'], 'New')
+
 class check_signer(unittest.TestCase):
     @classmethod
     def setUpClass(cls) :
@@ -216,3 +268,207 @@ class check_signer(unittest.TestCase):
         
         uid = self.sign.generate_uid()
         self.assertEqual(len(uid), 40)
+
+    def test_sign_many(self):
+        """ Sign a badge for several recipients """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        sf = signer.Signer(evidence='https://example.com/evidence',
+                           badge_type=BadgeType.SIGNED)
+        recipients = [b'one@example.com', 'two@example.com',
+                      Recipient(identity='three@example.com', evidence=None)]
+
+        signed = list(sf.sign_many(badge, recipients))
+
+        self.assertEqual(len(signed), 3)
+        self.assertEqual([b.get_identity() for b in signed],
+                  ['one@example.com', 'two@example.com', 'three@example.com'])
+        self.assertEqual(signed[0].evidence, 'https://example.com/evidence')
+        self.assertIsNone(signed[2].evidence)
+        self.assertEqual(len(set(b.get_serial_num() for b in signed)), 3)
+        for badge_signed in signed:
+            self.assertIn(b'openbadges:assertion', badge_signed.signed)
+
+    def test_sign_many_parallel(self):
+        """ Sign a badge for several recipients with a pool of processes """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        sf = signer.Signer(badge_type=BadgeType.SIGNED)
+        identities = ['user%d@example.com' % i for i in range(10)]
+
+        signed = list(sf.sign_many(badge, identities, jobs=2))
+
+        self.assertEqual([b.get_identity() for b in signed], identities)
+        for badge_signed in signed:
+            self.assertIs(badge_signed.source, badge)
+            self.assertTrue(badge_signed.signed.startswith(b'\x89PNG'))
+            self.assertIn(badge_signed.get_assertion().encode('utf-8'),
+                          badge_signed.signed)
+
+    def test_sign_many_parallel_old_python(self):
+        """ Without pool initializer the badge goes with every batch """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        sf = signer.Signer(badge_type=BadgeType.SIGNED)
+        identities = ['user%d@example.com' % i for i in range(20)]
+
+        with patch('openbadgeslib.signer.sys') as mock_sys:
+            mock_sys.version_info = (3, 6, 0)
+            signed = list(sf.sign_many(badge, identities, jobs=2))
+
+        self.assertEqual([b.get_identity() for b in signed], identities)
+
+    def test_sign_many_parallel_window(self):
+        """ The order is kept when more batches than the window are signed """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_4')
+        sf = signer.Signer(badge_type=BadgeType.SIGNED)
+        jobs = 2
+        count = jobs * 4 * sf.WORKER_BATCH_SIZE + 5
+        identities = ['user%d@example.com' % i for i in range(count)]
+
+        signed = list(sf.sign_many(badge, iter(identities), jobs=jobs))
+
+        self.assertEqual([b.get_identity() for b in signed], identities)
+        self.assertEqual(len(set(b.get_serial_num() for b in signed)), count)
+
+    def test_append_png_assertion(self):
+        """ The PNG chunks are kept and the assertion is spliced before IEND """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        sf = signer.Signer(identity=b'one@example.com',
+                           badge_type=BadgeType.SIGNED)
+        badge_signed = sf.sign_badge(badge)
+
+        tags = [tag for tag, offset, length in iter_chunks(badge_signed.signed)]
+        self.assertEqual(tags[-3:], [b'iTXt', b'tEXt', b'IEND'])
+        self.assertEqual(tags[:-3], [tag for tag, offset, length in iter_chunks(badge.image)][:-1])
+
+        iend = find_chunk(badge.image, b'IEND')
+        self.assertEqual(badge_signed.signed[:iend], badge.image[:iend])
+        self.assertEqual(badge_signed.signed[-12:], badge.image[iend:])
+
+    def test_png_truncated(self):
+        """ Truncated PNG files are detected """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        self.assertRaises(BadgeImgFormatIncorrect, find_chunk,
+                          badge.image[:-20], b'IEND')
+
+    def test_png_template(self):
+        """ A PNG template detects the assertion of the images it renders """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        template = PngBadgeTemplate(badge.image)
+        self.assertFalse(template.has_assertion())
+
+        signed = template.render(b'HEADER.BODY.SIGNATURE')
+        self.assertTrue(PngBadgeTemplate(signed).has_assertion())
+        self.assertEqual(template.render(b'HEADER.BODY.SIGNATURE'), signed)
+
+        badge.image = signed
+        self.assertTrue(self.sign.has_assertion(badge))
+
+    def test_svg_template(self):
+        """ The SVG template gives the same document than the DOM """
+
+        for name in ('withxmlheader.svg', 'withoutxmlheader.svg',
+                     'images/sample1.svg', 'images/userimage01.svg'):
+            with open(name, 'rb') as f:
+                template = SvgBadgeTemplate(f.read(), validate=True)
+
+            self.assertIsNotNone(template.prefix)
+            self.assertFalse(template.has_assertion())
+
+            signed = template.render(b'HEADER.BODY.SIGNATURE')
+            self.assertTrue(SvgBadgeTemplate(signed).has_assertion())
+
+    def test_sign_svg_twice(self):
+        """ Signed SVG badges can't be signed again """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        sf = signer.Signer(identity=b'one@example.com',
+                           badge_type=BadgeType.SIGNED, validate=True)
+        badge.image = sf.sign_badge(badge).signed
+
+        self.assertRaises(ErrorSigningFile, sf.sign_badge, badge)
+
+class check_recipients(unittest.TestCase):
+    def _write(self, suffix, content):
+        fd, name = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, name)
+        return name
+
+    def test_read_csv(self):
+        """ Read a CSV recipients file with header """
+
+        name = self._write('.csv', 'identity,evidence,expires\n'
+                                   'one@example.com,,\n'
+                                   '\n'
+                                   'two@example.com,https://example.com,10\n')
+        recipients = list(read_recipients_file(name, evidence='default'))
+
+        self.assertEqual([r.identity for r in recipients],
+                         [b'one@example.com', b'two@example.com'])
+        self.assertEqual(recipients[0].evidence, 'default')
+        self.assertIsNone(recipients[0].expiration)
+        self.assertEqual(recipients[1].evidence, 'https://example.com')
+        self.assertIsNotNone(recipients[1].expiration)
+
+    def test_read_jsonl(self):
+        """ Read a JSONL recipients file """
+
+        name = self._write('.jsonl', '{"identity": "one@example.com"}\n'
+                                     '{"identity": "two@example.com", "expires": 1}\n')
+        recipients = list(read_recipients_file(name))
+
+        self.assertEqual([r.get_identity() for r in recipients],
+                         ['one@example.com', 'two@example.com'])
+        self.assertIsNone(recipients[0].expiration)
+        self.assertIsNotNone(recipients[1].expiration)
+
+    def test_read_without_identity(self):
+        """ Entries without identity are rejected """
+
+        name = self._write('.jsonl', '{"evidence": "https://example.com"}\n')
+        self.assertRaises(RecipientsFileError, list, read_recipients_file(name))
+
+    def test_read_csv_bom(self):
+        """ The BOM of a CSV saved as UTF-8 by spreadsheets is skipped """
+
+        name = self._write('.csv', '\ufeffidentity,evidence,expires\n'
+                                   'one@example.com,,\n')
+        recipients = list(read_recipients_file(name))
+
+        self.assertEqual([r.identity for r in recipients], [b'one@example.com'])
+
+    def test_read_invalid_values(self):
+        """ Invalid identities and expirations are reported with their line """
+
+        for suffix, content in (('.csv', 'one@example.com,,soon\n'),
+                                ('.jsonl', '{"identity": "one@example.com", "expires": "x"}\n'),
+                                ('.jsonl', '{"identity": 1}\n')):
+            name = self._write(suffix, content)
+            with self.assertRaisesRegex(RecipientsFileError, 'Line 1 of'):
+                list(read_recipients_file(name))
+
+    def test_pending_recipients(self):
+        """ Repeated receptors and the ones already signed are skipped """
+
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        badge = Badge(image_type=BadgeImgType.SVG)
+        open(os.path.join(output, 'badge_1_two@example.com.svg'), 'wb').close()
+
+        recipients = [Recipient(identity=identity) for identity in
+                      ('one@example.com', 'two@example.com', 'one@example.com')]
+        skipped = []
+
+        with patch('builtins.print'):
+            pending = list(pending_recipients(recipients, 'badge_1', badge,
+                                              output, skipped))
+
+        self.assertEqual(pending, recipients[:1])
+        self.assertEqual(skipped, recipients[1:])
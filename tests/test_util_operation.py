@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import Mock, patch, mock_open, call
+
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.error import HTTPError
+
+import test_common
+
+from openbadgeslib.util import Fetcher, UrlChecker
+from openbadgeslib.badge import Badge
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'           # Keep-alive
+
+    def do_HEAD(self):
+        self.server.requests.append((self.client_address, 'HEAD', self.path))
+
+        if self.path == '/file':
+            self.send_response(200)
+            self.send_header('Content-Length', '7')
+        else:
+            self.send_response(405 if self.path == '/nohead' else 404)
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append((self.client_address, 'GET', self.path))
+
+        if self.path == '/nohead' and self.headers['Range'] == 'bytes=0-0':
+            self.send_response(206)
+            body = b'c'
+        elif self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/file')
+            body = b''
+        elif self.path == '/file':
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            body = b'content'
+        else:
+            self.send_response(404)
+            body = b'not found'
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class LocalServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer(('127.0.0.1', 0), LocalHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.fetcher = Fetcher(timeout=5)
+        self.addCleanup(self.fetcher.close)
+
+class check_fetcher(LocalServerTest):
+    def test_keep_alive(self):
+        """ The requests to a host reuse the same connection """
+
+        with patch('builtins.print'):
+            for i in range(3):
+                response = self.fetcher.fetch(self.url + '/file')
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.body, b'content')
+                self.assertEqual(response.get_header('etag'), '"v1"')
+
+        clients = set(request[0] for request in self.server.requests)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(clients), 1)
+
+    def test_redirect(self):
+        """ The redirections are followed """
+
+        with patch('builtins.print'):
+            response = self.fetcher.fetch(self.url + '/moved')
+
+        self.assertEqual(response.url, self.url + '/file')
+        self.assertEqual(response.body, b'content')
+
+    def test_errors(self):
+        """ The HTTP errors are raised like urllib does """
+
+        with patch('builtins.print'):
+            with self.assertRaises(HTTPError) as cm:
+                self.fetcher.fetch(self.url + '/missing')
+            self.assertEqual(cm.exception.code, 404)
+
+            # The connection is still usable
+            self.assertEqual(self.fetcher.fetch(self.url + '/file').body, b'content')
+
+    def test_closed_connection(self):
+        """ Idle connections closed by the server are replaced """
+
+        with patch('builtins.print'):
+            self.fetcher.fetch(self.url + '/file')
+            for idle in self.fetcher._pools.values():
+                for conn in idle:
+                    conn.sock.close()
+            self.assertEqual(self.fetcher.fetch(self.url + '/file').body, b'content')
+
+class check_url_checker(LocalServerTest):
+    def test_check(self):
+        """ The urls are checked with HEAD and the reachable ones cached """
+
+        checker = UrlChecker(fetcher=self.fetcher)
+        urls = [self.url + '/file', self.url + '/missing', self.url + '/nohead']
+
+        with patch('builtins.print'):
+            results = checker.check(urls)
+            self.assertIsNone(results[urls[0]])
+            self.assertIn('404', results[urls[1]])
+            self.assertIsNone(results[urls[2]])
+
+            self.assertEqual(sorted(request[1:] for request in self.server.requests),
+                             [('GET', '/nohead'), ('HEAD', '/file'),
+                              ('HEAD', '/missing'), ('HEAD', '/nohead')])
+
+            del self.server.requests[:]
+            results = checker.check(urls)
+            self.assertEqual(sorted(request[1:] for request in self.server.requests),
+                             [('HEAD', '/missing')])
+
+    def test_badge(self):
+        """ The urls of a badge are checked with the checker """
+
+        badge = Badge(image_url=self.url + '/file', criteria_url=self.url + '/file',
+                      json_url=self.url + '/file', verify_key_url=self.url + '/missing')
+        checker = UrlChecker(ttl=0, fetcher=self.fetcher)
+
+        with patch('builtins.print') as mock_print:
+            self.assertTrue(badge.urls_has_problems(checker))
+            mock_print.assert_called_with('[!] OpenBadge Verify key at config file is poiting to a wrong url %s/missing' % self.url)
+
+            badge.verify_key_url = self.url + '/file'
+            self.assertFalse(badge.urls_has_problems(checker))
@@ -2,16 +2,458 @@ import unittest
 from unittest.mock import Mock, patch, mock_open, call
 
 import functools, hashlib
+import asyncio, json
+import zlib
+import os, shutil, tempfile
 
 import test_common
 
-from openbadgeslib import verifier
-from openbadgeslib.errors import UnknownKeyType
+from openbadgeslib import verifier, signer
+from openbadgeslib.asyncverifier import AsyncVerifier
+from openbadgeslib.bundle import TrustBundle
+from openbadgeslib.jws import utils as jws_utils
+from openbadgeslib.errors import UnknownKeyType, ErrorParsingFile, \
+        VerifyKeyUnavailable
 from openbadgeslib.confparser import ConfParser
 from openbadgeslib.keys import KeyType
+from openbadgeslib.badge import Badge, BadgeType, BadgeSigned, BadgeStatus, \
+        extract_svg_assertion, extract_png_assertion
+from openbadgeslib.pngutils import find_chunk, find_itxt, make_chunk
+from openbadgeslib.resolver import KeyResolver, LocalKeyResolver, \
+        DownloadKeyResolver
+from openbadgeslib.cache import RevocationCache
+from openbadgeslib.util import HttpResponse
 
 class check_verifier_factory(unittest.TestCase) :
     @classmethod
     def setUpClass(cls) :
         cls.verifier = verifier.Verifier()
 
+BADGES = (('badge_test_1', '.svg'), ('badge_test_2', '.svg'),
+          ('badge_test_3', '.png'), ('badge_test_4', '.png'))
+
+class checkSignedBadgesBase :
+    @classmethod
+    def setUpClass(cls) :
+        cf = ConfParser('./config1.ini')
+        cls.conf = cf.read_conf()
+        cls.sign = signer.Signer(identity=b'one@example.com',
+                                 badge_type=BadgeType.SIGNED)
+
+    def _save(self, badge_signed, suffix):
+        fd, name = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, name)
+        badge_signed.save_to_file(name)
+        return name
+
+    def _issuer_files(self):
+        """ Return the json files of the issuer of the test badges, by url,
+            without the revocation list """
+
+        return {'https://openbadges.luisgf.es/issuer/badge_1/badge.json':
+                    b'{"issuer": "https://openbadges.luisgf.es/issuer/organization.json"}',
+                'https://openbadges.luisgf.es/issuer/organization.json':
+                    b'{"revocationList": "https://openbadges.luisgf.es/issuer/revoked.json"}'}
+
+    def _read_signed(self, files, badges=BADGES):
+        """ Sign the badges, returning them read back from file. Their
+            verify keys are added to files """
+
+        batch = []
+        for badge_name, suffix in badges:
+            badge = Badge.create_from_conf(self.conf, badge_name)
+            files[badge.verify_key_url] = badge.pubkey_pem
+            name = self._save(self.sign.sign_badge(badge), suffix)
+            batch.append(BadgeSigned.read_from_file(name))
+
+        return batch
+
+    def _read_bad_signed(self, files):
+        """ Return badges that can't be verified: with unsupported JWS
+            headers, a corrupted signature and an issuer without revocation
+            list """
+
+        files['https://openbadges.luisgf.es/issuer/badge_2/badge.json'] = \
+                b'{"issuer": "https://openbadges.luisgf.es/issuer/other.json"}'
+        files['https://openbadges.luisgf.es/issuer/other.json'] = b'{}'
+
+        bad = self._read_signed(files, [('badge_test_1', '.svg')]*3)
+        bad[0].assertion.encode_header({'alg': 'RS256', 'kid': 'x'})
+        bad[1].assertion.encode_header({'alg': 'none'})
+        bad[2].assertion.signature = b'!' + bad[2].assertion.signature[1:]
+        bad[2].assertion.raw = None
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        badge.json_url = 'https://openbadges.luisgf.es/issuer/badge_2/badge.json'
+        name = self._save(self.sign.sign_badge(badge), '.svg')
+        bad.append(BadgeSigned.read_from_file(name))
+
+        return bad
+
+    def _check_bad_badges(self, checks):
+        """ Check the results of a valid badge, the bad ones and a valid
+            one again """
+
+        self.assertEqual([check.status for check in checks],
+                         [BadgeStatus.VALID] + [BadgeStatus.SIGNATURE_ERROR]*4 +
+                         [BadgeStatus.VALID])
+        for check in checks[1:-1]:
+            self.assertTrue(check.msg)
+
+    def _tamper(self, badge_read, badge_name):
+        """ Replace the signature of a badge with the one of other assertion
+            of the same badge """
+
+        other = Badge.create_from_conf(self.conf, badge_name)
+        badge_read.assertion.signature = \
+                self.sign.sign_badge(other).assertion.signature
+        badge_read.assertion.raw = None
+
+class check_extract_assertion(checkSignedBadgesBase, unittest.TestCase):
+    def test_extract_svg_assertion(self):
+        """ Extract the assertion of a signed SVG badge """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        badge_signed = self.sign.sign_badge(badge)
+
+        for block_size in (7, 65536):
+            assertion = extract_svg_assertion(badge_signed.signed, block_size)
+            self.assertEqual(assertion.get_assertion(),
+                             badge_signed.assertion.get_assertion())
+
+    def test_extract_svg_without_assertion(self):
+        """ SVG files without assertion or malformed are detected """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        self.assertRaises(ErrorParsingFile, extract_svg_assertion, badge.image)
+        self.assertRaises(ErrorParsingFile, extract_svg_assertion, b'<svg><g></svg>')
+
+    def test_extract_png_assertion(self):
+        """ Extract the assertion of a signed PNG badge """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        badge_signed = self.sign.sign_badge(badge)
+
+        assertion = extract_png_assertion(badge_signed.signed)
+        self.assertEqual(assertion.get_assertion(),
+                         badge_signed.assertion.get_assertion())
+        self.assertRaises(ErrorParsingFile, extract_png_assertion, badge.image)
+
+    def test_extract_png_compressed_assertion(self):
+        """ Compressed iTXt chunks are supported """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        payload = b'HEADER.BODY.SIGNATURE'
+        itxt = make_chunk(b'iTXt', b'openbadges\x00\x01\x00en\x00\x00' + zlib.compress(payload))
+        iend = find_chunk(badge.image, b'IEND')
+        image = badge.image[:iend] + itxt + badge.image[iend:]
+
+        self.assertEqual(find_itxt(image, b'openbadges'), payload)
+        self.assertEqual(extract_png_assertion(image).get_assertion(), payload)
+
+    def test_read_from_file(self):
+        """ Read signed badges from file, the key is resolved on demand """
+
+        for badge_name, suffix in (('badge_test_1', '.svg'),
+                                   ('badge_test_3', '.png')):
+            badge = Badge.create_from_conf(self.conf, badge_name)
+            badge_signed = self.sign.sign_badge(badge)
+            name = self._save(badge_signed, suffix)
+
+            resolver = LocalKeyResolver(badge.pubkey_pem)
+            with patch.object(resolver, 'resolve', wraps=resolver.resolve) as resolve:
+                badge_read = BadgeSigned.read_from_file(name, key_resolver=resolver)
+                self.assertFalse(resolve.called)
+
+                self.assertEqual(badge_read.get_signkey_pem(), badge.pubkey_pem)
+                self.assertIsNotNone(badge_read.resolve_key())
+                resolve.assert_called_once_with(badge.verify_key_url)
+
+            self.assertEqual(badge_read.assertion.get_assertion(),
+                             badge_signed.assertion.get_assertion())
+            self.assertEqual(badge_read.serial_num, badge_signed.get_serial_num())
+
+    def test_read_from_empty_file(self):
+        """ Empty files can't be read """
+
+        fd, name = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        self.addCleanup(os.remove, name)
+        self.assertRaises(ErrorParsingFile, BadgeSigned.read_from_file, name)
+
+class check_verifier(checkSignedBadgesBase, unittest.TestCase):
+    def test_verify_key_unavailable(self):
+        """ Failures resolving the verify key are reported """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        name = self._save(self.sign.sign_badge(badge), '.svg')
+
+        resolver = KeyResolver()
+        badge_read = BadgeSigned.read_from_file(name, key_resolver=resolver)
+        self.assertRaises(VerifyKeyUnavailable, badge_read.resolve_key)
+
+        v = verifier.Verifier(identity='one@example.com')
+        check = v.get_badge_status(badge_read)
+        self.assertIs(check.status, BadgeStatus.SIGNATURE_ERROR)
+
+    def test_verify_signature(self):
+        """ Verify the signature of badges read from file """
+
+        for badge_name, suffix in (('badge_test_1', '.svg'),
+                                   ('badge_test_2', '.svg'),
+                                   ('badge_test_3', '.png'),
+                                   ('badge_test_4', '.png')):
+            badge = Badge.create_from_conf(self.conf, badge_name)
+            name = self._save(self.sign.sign_badge(badge), suffix)
+            badge_read = BadgeSigned.read_from_file(name,
+                                key_resolver=LocalKeyResolver(badge.pubkey_pem))
+
+            v = verifier.Verifier(identity='one@example.com')
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+            self.assertTrue(v.check_identity(badge_read))
+
+            v = verifier.Verifier(identity='two@example.com',
+                                  verify_key=badge.pubkey_pem)
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+            self.assertFalse(v.check_identity(badge_read))
+
+            v = verifier.Verifier(identity='one@example.com', precompute=True)
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+
+    def test_tampered_signature(self):
+        """ Badges with a wrong signature are reported """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        name = self._save(self.sign.sign_badge(badge), '.svg')
+        badge_read = BadgeSigned.read_from_file(name,
+                                key_resolver=LocalKeyResolver(badge.pubkey_pem))
+        self._tamper(badge_read, 'badge_test_1')
+
+        v = verifier.Verifier(identity='one@example.com')
+        self.assertIs(v.get_badge_status(badge_read).status, BadgeStatus.SIGNATURE_ERROR)
+
+    def test_decode_once(self):
+        """ The assertion is decoded once and verified without copies """
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_3')
+        name = self._save(self.sign.sign_badge(badge), '.png')
+
+        with patch('openbadgeslib.jws.utils.decode', wraps=jws_utils.decode) as decode:
+            badge_read = BadgeSigned.read_from_file(name,
+                                key_resolver=LocalKeyResolver(badge.pubkey_pem))
+            v = verifier.Verifier(identity='one@example.com')
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+            self.assertEqual(decode.call_count, 2)       # Header and body
+
+        signing_input = badge_read.assertion.get_signing_input()
+        self.assertIsInstance(signing_input, memoryview)
+        self.assertIs(signing_input.obj, badge_read.assertion.get_assertion())
+
+class check_verify_many(checkSignedBadgesBase, unittest.TestCase):
+    def test_verify_many(self):
+        """ Verify a batch of badges fetching every url once """
+
+        files = self._issuer_files()
+        files['https://openbadges.luisgf.es/issuer/revoked.json'] = b'{}'
+        requests = []
+
+        def fetch(url, headers=None):
+            requests.append(url)
+            return HttpResponse(url, 200, {}, files[url])
+
+        batch = self._read_signed(files)
+
+        # Other badge of the same issuer
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        badge.json_url = 'https://openbadges.luisgf.es/issuer/badge_2/badge.json'
+        files[badge.json_url] = \
+                files['https://openbadges.luisgf.es/issuer/badge_1/badge.json']
+        name = self._save(self.sign.sign_badge(badge), '.svg')
+        batch.append(BadgeSigned.read_from_file(name))
+
+        v = verifier.Verifier(identity='one@example.com',
+                    revocation_cache=RevocationCache(interval=0, fetch=fetch))
+        checks = list(v.verify_many(batch + [(batch[0], 'two@example.com')]))
+
+        self.assertEqual([check.status for check in checks],
+                         [BadgeStatus.VALID]*5 + [BadgeStatus.IDENTITY_ERROR])
+        self.assertEqual(sorted(requests), sorted(files))
+
+        # The cache of the batch is not left in the badges
+        for badge_read in batch:
+            self.assertIsInstance(badge_read.key_resolver, DownloadKeyResolver)
+
+    def test_bad_badges(self):
+        """ A badge that can't be verified doesn't stop the batch """
+
+        files = self._issuer_files()
+        files['https://openbadges.luisgf.es/issuer/revoked.json'] = b'{}'
+
+        def fetch(url, headers=None):
+            return HttpResponse(url, 200, {}, files[url])
+
+        good = self._read_signed(files, [('badge_test_2', '.svg')])
+        batch = good + self._read_bad_signed(files) + good
+
+        v = verifier.Verifier(identity='one@example.com',
+                    revocation_cache=RevocationCache(interval=0, fetch=fetch))
+        self._check_bad_badges(list(v.verify_many(batch)))
+
+class check_async_verifier(checkSignedBadgesBase, unittest.TestCase):
+    def test_verify_many(self):
+        """ Verify a batch of badges with asyncio and a local transport """
+
+        files = self._issuer_files()
+        requests = []
+        running = [0, 0]                    # Now, maximum
+
+        async def transport(url, headers=None):
+            requests.append(url)
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return HttpResponse(url, 200, {}, files[url])
+
+        batch = self._read_signed(files)
+
+        revoked = batch[3].serial_num
+        files['https://openbadges.luisgf.es/issuer/revoked.json'] = \
+                json.dumps({revoked: 'Cheating'}).encode('utf-8')
+
+        v = AsyncVerifier(identity='one@example.com', transport=transport,
+                          concurrency=2)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with patch('openbadgeslib.asyncverifier.jws_utils.from_json',
+                   wraps=jws_utils.from_json) as from_json:
+            checks = loop.run_until_complete(
+                        v.verify_many(batch + [(batch[0], 'two@example.com')]))
+
+        self.assertEqual([check.status for check in checks],
+                         [BadgeStatus.VALID]*3 + [BadgeStatus.REVOKED,
+                                                  BadgeStatus.IDENTITY_ERROR])
+        self.assertEqual(sorted(requests), sorted(files))
+        self.assertEqual(running[1], 2)
+
+        # The badge, issuer and revocation list json, once
+        parsed = [args[0] for args, kwargs in from_json.call_args_list
+                  if args[0] in files.values()]
+        self.assertEqual(len(parsed), 3)
+
+    def test_bad_badges(self):
+        """ A badge that can't be verified doesn't stop the batch, and no
+            task is left pending """
+
+        files = self._issuer_files()
+        files['https://openbadges.luisgf.es/issuer/revoked.json'] = b'{}'
+
+        async def transport(url, headers=None):
+            return HttpResponse(url, 200, {}, files[url])
+
+        good = self._read_signed(files, [('badge_test_2', '.svg')])
+        batch = good + self._read_bad_signed(files) + good
+
+        v = AsyncVerifier(identity='one@example.com', transport=transport)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        self._check_bad_badges(loop.run_until_complete(v.verify_many(batch)))
+
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        self.assertEqual([task for task in all_tasks(loop) if not task.done()], [])
+
+    def test_tampered_signature(self):
+        """ No download is left pending after a badge with a wrong signature """
+
+        files = self._issuer_files()
+        del files['https://openbadges.luisgf.es/issuer/organization.json']
+        badge_read, = self._read_signed(files, [('badge_test_2', '.svg')])
+        self._tamper(badge_read, 'badge_test_2')
+
+        async def transport(url, headers=None):
+            if url not in files:
+                await asyncio.sleep(60)     # The issuer files are slow
+            return HttpResponse(url, 200, {}, files[url])
+
+        v = AsyncVerifier(identity='one@example.com', transport=transport)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        checks = loop.run_until_complete(v.verify_many([badge_read]))
+
+        self.assertIs(checks[0].status, BadgeStatus.SIGNATURE_ERROR)
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        self.assertEqual([task for task in all_tasks(loop) if not task.done()], [])
+        self.assertIsInstance(badge_read.key_resolver, DownloadKeyResolver)
+
+class check_trust_bundle(checkSignedBadgesBase, unittest.TestCase):
+    def test_verify_offline(self):
+        """ Verify badges without network with a trust bundle """
+
+        bundle_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bundle_dir)
+        os.mkdir(os.path.join(bundle_dir, 'badge_1'))
+
+        badge = Badge.create_from_conf(self.conf, 'badge_test_1')
+        badge_signed = self.sign.sign_badge(badge)
+
+        files = {'organization.json': b'{"revocationList": "https://issuer.badge/issuer/revoked.json"}',
+                 'revoked.json': json.dumps({badge_signed.get_serial_num(): 'Cheating'}).encode('utf-8'),
+                 'badge_1/badge.json': b'{"issuer": "https://issuer.badge/issuer/organization.json"}',
+                 'badge_1/verify.pem': badge.pubkey_pem}
+        for name, contents in files.items():
+            with open(os.path.join(bundle_dir, name), 'wb') as f:
+                f.write(contents)
+
+        bundle = TrustBundle(bundle_dir)
+        name = self._save(badge_signed, '.svg')
+
+        with patch('openbadgeslib.util.Fetcher.request') as request:
+            badge_read = BadgeSigned.read_from_file(name, key_resolver=bundle)
+            v = verifier.Verifier(identity='one@example.com', key_resolver=bundle,
+                    revocation_cache=RevocationCache(fetch=bundle.fetch))
+            self.assertIs(v.check_jws_signature(badge_read).status, BadgeStatus.VALID)
+            self.assertEqual(v.get_badge_status(badge_read).status, BadgeStatus.REVOKED)
+            self.assertFalse(request.called)
+
+        self.assertRaises(VerifyKeyUnavailable, bundle.resolve,
+                          'https://issuer.badge/badge_2/verify.pem')
+
+class check_jws_routes(unittest.TestCase):
+    def test_cached_route(self):
+        """ The routes of reusable algorithms are memoized """
+
+        from openbadgeslib.jws import algos, header
+        from openbadgeslib.jws.exceptions import AlgorithmNotImplemented
+
+        algos.clear_routes()
+        with patch.object(algos, 'find', wraps=algos.find) as find:
+            route = algos.cached_route('ES256')
+            self.assertIs(algos.cached_route('ES256'), route)
+            self.assertEqual(find.call_count, 1)
+
+            data = {'header': {'alg': 'ES256'}, 'verifier': None}
+            header.process(data, 'verify')
+            self.assertIs(data['verifier'], route['verify'])
+            self.assertEqual(find.call_count, 1)
+
+        self.assertRaises(AlgorithmNotImplemented, header.process,
+                          {'header': {'alg': 'XX256'}}, 'sign')
+
+    def test_rsa_reusable(self):
+        """ RSA algorithms can be memoized and used several times """
+
+        from openbadgeslib.jws import algos
+        from Crypto.PublicKey import RSA
+
+        with open('test_sign_rsa.pem', 'rb') as f:
+            key = RSA.importKey(f.read())
+
+        algos.clear_routes()
+        route = algos.cached_route('RS256')
+        self.assertIs(algos.cached_route('RS256'), route)
+
+        for msg in (b'first', b'second', b'second'):
+            signature = route['sign'](msg, key)
+            self.assertTrue(route['verify'](msg, signature, key.publickey()))